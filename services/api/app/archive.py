@@ -0,0 +1,76 @@
+import os
+from datetime import datetime
+from typing import Dict, Optional
+import pyarrow.parquet as pq
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from .config import settings
+from .exports import iter_rows, iter_parquet
+from .metrics import runs_span
+from .models import Run, RunView
+from .utils import TPE
+
+# Monthly Parquet archive of runs: ARCHIVE_DIR/<equipment>/<YYYYMM>.parquet, one file per closed
+# month (runs attributed to the month they start). pandas/DuckDB read these without MySQL, e.g.
+# duckdb: SELECT ... FROM read_parquet('/exports/archive/*/*.parquet')
+ARCHIVE_COLUMNS = [(c.name, c) for c in RunView.__table__.columns]
+FINGERPRINT_KEY = "s100.fingerprint"
+
+def month_path(equipment: str, year: int, month: int) -> str:
+    return os.path.join(settings.ARCHIVE_DIR, equipment, f"{year:04d}{month:02d}.parquet")
+
+def _next_month(year: int, month: int):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+def _fingerprint(db: Session, equipment: str, start: datetime, end: datetime) -> Optional[str]:
+    # changes whenever a run of the month is added or extended; None when the month has no runs
+    n, dur, src, last_id, last_sp = db.execute(
+        select(func.count(), func.sum(Run.duration_s), func.sum(Run.source_count), func.max(Run.id), func.max(Run.sp_time))
+        .where(Run.equipment == equipment, Run.st_time >= start, Run.st_time < end)
+    ).one()
+    return f"{n}:{dur}:{src}:{last_id}:{last_sp}" if n else None
+
+def archive_month(db: Session, equipment: str, year: int, month: int, force: bool = False) -> Optional[str]:
+    # (re)write one month; returns the path when written, None when unchanged or empty.
+    # The fingerprint is taken before the rows, so a file is never labelled newer than its content
+    start = datetime(year, month, 1)
+    end = datetime(*_next_month(year, month), 1)
+    fp = _fingerprint(db, equipment, start, end)
+    path = month_path(equipment, year, month)
+    if fp is None:
+        return None
+    if not force and os.path.exists(path):
+        meta = pq.read_schema(path).metadata or {}
+        if meta.get(FINGERPRINT_KEY.encode()) == fp.encode():
+            return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    stmt = (select(*(c for _, c in ARCHIVE_COLUMNS))
+            .where(RunView.equipment == equipment, RunView.st_time >= start, RunView.st_time < end)
+            .order_by(RunView.st_time))
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in iter_parquet(iter_rows(stmt, bind=db.get_bind()), ARCHIVE_COLUMNS, {FINGERPRINT_KEY: fp}):
+                f.write(chunk)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return path
+
+def archive_closed_months(db: Session, equipment: str, force: bool = False) -> Dict:
+    # every month from the first run up to last month; the current month is still being written
+    span = runs_span(db, equipment)
+    out = {"written": [], "skipped": 0}
+    if span is None:
+        return out
+    now = datetime.now(TPE)
+    y, m = span[0].year, span[0].month
+    while (y, m) < (now.year, now.month):
+        path = archive_month(db, equipment, y, m, force)
+        if path:
+            out["written"].append(path)
+        else:
+            out["skipped"] += 1  # unchanged or no runs
+        y, m = _next_month(y, m)
+    return out
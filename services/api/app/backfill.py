@@ -0,0 +1,73 @@
+import contextvars
+import time
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Tuple, Optional
+from .config import settings
+from .db import SessionLocal
+from . import telemetry
+from .ingest import iter_record_batches, ingest_file, list_history_files, empty_stats, file_fingerprint, skip_unchanged
+
+def parse_file(equipment: str, path: str) -> Tuple[list, Dict[str, float], Dict, Dict]:
+    # worker-process side: read + parse + hash a whole file into record batches, plus its manifest
+    # and the reader's bytes / seconds (metrics are recorded in the API process)
+    t0 = time.perf_counter()
+    timings = {"parse": 0.0}
+    read_info = {}
+    manifest = file_fingerprint(path)
+    batches = list(iter_record_batches(equipment, path, timings=timings, read_info=read_info))
+    timings["read"] = max(0.0, time.perf_counter() - t0 - timings["parse"])
+    return batches, timings, read_info, manifest
+
+def _backfill_equipment(pool: ProcessPoolExecutor, equipment: str, files: List[str], ahead: int, progress=None,
+                        force: bool = False) -> Dict:
+    # single writer per equipment: files are written strictly in chronological order so run
+    # merging gives the same result as the serial ingest_historical; files already ingested with
+    # the same content are skipped unless force
+    stats = empty_stats()
+    timings = []
+    pending = deque()
+    with SessionLocal() as db:
+        files, stats["files_skipped"] = skip_unchanged(db, equipment, files, force)
+        todo = iter(files)
+
+        def submit_next():
+            path = next(todo, None)
+            if path:
+                pending.append((path, pool.submit(parse_file, equipment, path)))
+
+        for _ in range(ahead):
+            submit_next()
+        while pending:
+            path, fut = pending.popleft()
+            batches, parse_t, read_info, manifest = fut.result()
+            parse_s = parse_t["read"] + parse_t["parse"]
+            telemetry.observe_stages(equipment, parse_t)  # ingest_file times the write stages
+            telemetry.observe_read(read_info)
+            submit_next()
+            t0 = time.perf_counter()
+            st = ingest_file(db, equipment, path, batches=batches, progress=progress, manifest=manifest)
+            write_s = time.perf_counter() - t0
+            for k, v in st.items():
+                stats[k] += v
+            timings.append(dict(equipment=equipment, file=path, parse_s=round(parse_s, 3), write_s=round(write_s, 3),
+                                **{k: st[k] for k in ("lines", "raw_new", "raw_dup", "runs_new", "runs_dups_or_replaced")}))
+    stats["files"] = timings
+    return stats
+
+def backfill_historical(targets, workers: Optional[int] = None, progress=None, force: bool = False) -> Dict[str, Dict]:
+    # targets: equipment.Target (name, log_root, hist_dir_name); parsing fans out over a process pool,
+    # writes stay per equipment with at most EQUIPMENT_WORKERS machines written at once
+    workers = workers or settings.BACKFILL_WORKERS
+    ahead = workers + 1  # parsed files waiting per writer; bounds memory
+    # spawn: the API process runs scheduler/worker threads, which fork() does not play well with
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool, \
+         ThreadPoolExecutor(max_workers=max(1, min(settings.EQUIPMENT_WORKERS, len(targets)))) as writers:
+        futs = {
+            # copy_context: SQL from the writer threads keeps the calling job's metrics label
+            t.name: writers.submit(contextvars.copy_context().run, _backfill_equipment, pool, t.name,
+                                   list_history_files(t.log_root, t.hist_dir_name), ahead, progress, force)
+            for t in targets
+        }
+        return {equip: f.result() for equip, f in futs.items()}
@@ -7,9 +7,27 @@ class Settings:
     DB_USER: str = os.getenv("DB_USER", "app")
     DB_PASS: str = os.getenv("DB_PASS", "app123")
     TZ: str = os.getenv("TZ", "Asia/Taipei")
+    # equipment registry source: JSON list of {"name", "log_root", "hist_dir_name"?, "enabled"?};
+    # without it an empty registry is seeded from LOG_ROOT_S100_1/2
+    EQUIPMENT_FILE: str = os.getenv("EQUIPMENT_FILE", "")
+    EQUIPMENT_WORKERS: int = int(os.getenv("EQUIPMENT_WORKERS", "4"))  # machines ingested/recomputed concurrently
     LOG_ROOT_S100_1: str = os.getenv("LOG_ROOT_S100_1", "/data/s100-1")
     LOG_ROOT_S100_2: str = os.getenv("LOG_ROOT_S100_2", "/data/s100-2")
     HIST_DIR_NAME: str = os.getenv("HIST_DIR_NAME", "S100_test_log")
     API_TOKEN: str = os.getenv("API_TOKEN", "")
+    BACKFILL_WORKERS: int = int(os.getenv("BACKFILL_WORKERS", str(min(4, os.cpu_count() or 1))))  # parse processes
+    INGEST_JOB_WORKERS: int = int(os.getenv("INGEST_JOB_WORKERS", "2"))  # concurrent background ingest jobs
+    WATCH_MODE: str = os.getenv("WATCH_MODE", "auto")  # off | auto (inotify, polling on SMB/NFS) | inotify | poll
+    WATCH_POLL_S: float = float(os.getenv("WATCH_POLL_S", "5"))
+    WATCH_DEBOUNCE_S: float = float(os.getenv("WATCH_DEBOUNCE_S", "3"))  # quiet time after the last append
+    WATCH_MAX_DELAY_S: float = float(os.getenv("WATCH_MAX_DELAY_S", "60"))  # ingest anyway during a long burst
+    WATCH_MIN_INTERVAL_S: float = float(os.getenv("WATCH_MIN_INTERVAL_S", "30"))  # per-equipment rate limit
+    SHIFTS: str = os.getenv("SHIFTS", "day=08:00-20:00,night=20:00-08:00")  # /metrics/utilization?granularity=shift
+    EXPORT_DIR: str = os.getenv("EXPORT_DIR", "/exports")
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "/exports/archive")  # monthly Parquet files per equipment
+    EXPORT_CACHE_MB: int = int(os.getenv("EXPORT_CACHE_MB", "2048"))  # cached XLSX reports, LRU-evicted beyond this
+    RESPONSE_CACHE_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_ENTRIES", "512"))  # /metrics/* results kept in memory
+    RESPONSE_CACHE_TTL_S: float = float(os.getenv("RESPONSE_CACHE_TTL_S", "600"))
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "2000"))  # lines per raw_logs lookup/insert
 
 settings = Settings()
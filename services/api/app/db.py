@@ -8,3 +8,23 @@ SessionLocal = sessionmaker(bind=engine, expire_on_commit=False, autoflush=False
 
 class Base(DeclarativeBase):
     pass
+
+class ViewBase(DeclarativeBase):
+    # read-only views; created by migrations.create_views, never by create_all
+    pass
+
+def upsert(db, table, rows, keys):
+    # bulk insert-or-update on a unique key; one executemany statement per call
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    cols = [c for c in rows[0] if c not in keys]
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        stmt = stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in cols})
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=keys, set_={c: stmt.excluded[c] for c in cols})
+    db.execute(stmt, rows)
@@ -0,0 +1,98 @@
+import hashlib
+import threading
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import Session
+from .models import DimText, DimProject, DimMeta, DimLogname
+
+# Dictionary encoding for raw_log_rows / run_rows: every distinct value tuple gets one row in a
+# dim_* table, looked up by key_hash (sha1 of the exact values, so unique regardless of collation
+# and index length limits). Ids are cached per process; ids of rows this transaction may have
+# inserted stay in session.info until it commits, so a rollback never leaves a dangling id behind.
+CACHE_MAX = 200_000
+IN_CHUNK = 1000
+_PENDING = "s100_dim_pending"
+
+# record field -> (dim table, record fields holding its VALUE_COLS)
+RECORD_DIMS = (
+    ("source_file_id", DimText, ("source_file",)),
+    ("project_raw_id", DimText, ("project_raw",)),
+    ("logname_raw_id", DimText, ("logname_raw",)),
+    ("project_id", DimProject, ("project_customer", "project_code")),
+    ("meta_id", DimMeta, ("user", "prgver", "codever")),
+    ("logname_id", DimLogname, DimLogname.VALUE_COLS),
+)
+
+_cache: Dict[str, Dict[tuple, int]] = {}
+_lock = threading.Lock()
+
+def key_hash(values: Iterable) -> bytes:
+    # None and "" are different keys
+    s = "\x1f".join("\x00" if v is None else str(v) for v in values)
+    return hashlib.sha1(s.encode("utf-8", errors="ignore")).digest()
+
+def _by_hash(db: Session, dim, hashes: List[bytes], lock: bool = False) -> Dict[bytes, int]:
+    out = {}
+    for i in range(0, len(hashes), IN_CHUNK):
+        q = select(dim.key_hash, dim.id).where(dim.key_hash.in_(hashes[i:i + IN_CHUNK]))
+        if lock:
+            q = q.with_for_update(read=True)  # latest committed rows, not the transaction snapshot
+        out.update(db.execute(q).all())
+    return out
+
+def lookup(db: Session, dim, values: Iterable[tuple]) -> Dict[tuple, int]:
+    # value tuple -> id, inserting tuples not seen before
+    name = dim.__tablename__
+    cache = _cache.setdefault(name, {})
+    pending = db.info.setdefault(_PENDING, {}).setdefault(name, {})
+    out, missing = {}, {}
+    for v in set(values):
+        i = cache.get(v)
+        if i is None:
+            i = pending.get(v)
+        if i is None:
+            missing[key_hash(v)] = v
+        else:
+            out[v] = i
+    if not missing:
+        return out
+    found = _by_hash(db, dim, list(missing))
+    with _lock:
+        if len(cache) + len(found) > CACHE_MAX:
+            cache.clear()
+        for h, i in found.items():
+            cache[missing[h]] = out[missing[h]] = i
+    todo = sorted(h for h in missing if h not in found)  # fixed order: concurrent writers lock rows alike
+    if todo:
+        stmt = insert(dim.__table__).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+        db.execute(stmt, [dict(zip(dim.VALUE_COLS, missing[h]), key_hash=h) for h in todo])
+        for h, i in _by_hash(db, dim, todo, lock=True).items():
+            pending[missing[h]] = out[missing[h]] = i
+    return out
+
+def attach(db: Session, records: List[Dict], fields: Optional[Iterable[str]] = None):
+    # set the *_id fields (all of RECORD_DIMS, or just `fields`) from the records' string columns
+    spec = [d for d in RECORD_DIMS if fields is None or d[0] in fields]
+    wanted = {}
+    for _, dim, cols in spec:
+        wanted.setdefault(dim, set()).update(tuple(r[c] for c in cols) for r in records)
+    ids = {dim: lookup(db, dim, vals) for dim, vals in wanted.items()}
+    for r in records:
+        for field, dim, cols in spec:
+            r[field] = ids[dim][tuple(r[c] for c in cols)]
+
+@event.listens_for(Session, "after_commit")
+def _promote(session):
+    pending = session.info.pop(_PENDING, None)
+    if not pending:
+        return
+    with _lock:
+        for name, ids in pending.items():
+            cache = _cache.setdefault(name, {})
+            if len(cache) + len(ids) > CACHE_MAX:
+                cache.clear()
+            cache.update(ids)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard(session, previous_transaction):
+    session.info.pop(_PENDING, None)
@@ -0,0 +1,68 @@
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from .config import settings
+from .db import upsert
+from .models import Equipment
+from .utils import TPE
+
+# Equipment registry: the `equipment` table lists every tester with its log root and history dir.
+# EQUIPMENT_FILE (when set) is the source of truth and is synced into the table at startup;
+# ingest, watcher, nightly job and dashboard all read the table.
+
+class Target(NamedTuple):
+    name: str
+    log_root: str
+    hist_dir_name: str
+
+def _load_file(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    for it in items:
+        if not it.get("name") or not it.get("log_root"):
+            raise ValueError(f"{path}: every equipment needs name and log_root, got {it!r}")
+    return items
+
+def sync_registry(db: Session) -> List[Target]:
+    # file entries are upserted and anything not in the file is disabled; without a file an empty
+    # registry gets the two original testers from LOG_ROOT_S100_1/2
+    now = datetime.now(TPE).replace(tzinfo=None)
+    if settings.EQUIPMENT_FILE:
+        items = _load_file(settings.EQUIPMENT_FILE)
+    elif db.execute(select(Equipment.name).limit(1)).first() is None:
+        items = [dict(name="s100-1", log_root=settings.LOG_ROOT_S100_1),
+                 dict(name="s100-2", log_root=settings.LOG_ROOT_S100_2)]
+    else:
+        return list_targets(db)
+    upsert(db, Equipment.__table__, [
+        dict(name=it["name"], log_root=it["log_root"], hist_dir_name=it.get("hist_dir_name"),
+             enabled=int(bool(it.get("enabled", True))), updated_at=now)
+        for it in items
+    ], ["name"])
+    if settings.EQUIPMENT_FILE:
+        db.execute(update(Equipment).where(Equipment.name.not_in([it["name"] for it in items]), Equipment.enabled == 1)
+                   .values(enabled=0, updated_at=now))
+    db.commit()
+    return list_targets(db)
+
+def list_targets(db: Session, names: Optional[List[str]] = None) -> List[Target]:
+    # enabled equipment, optionally limited to names
+    q = select(Equipment).where(Equipment.enabled == 1).order_by(Equipment.name)
+    if names is not None:
+        q = q.where(Equipment.name.in_(names))
+    return [Target(e.name, e.log_root, e.hist_dir_name or settings.HIST_DIR_NAME) for e in db.scalars(q)]
+
+def fan_out(fn: Callable, items, workers: Optional[int] = None) -> list:
+    # fn(item) for each equipment on its own thread, at most EQUIPMENT_WORKERS at once; fn opens its
+    # own Session. Results in input order; the first failure is raised after the others finish
+    items = list(items)
+    if not items:
+        return []
+    workers = min(workers or settings.EQUIPMENT_WORKERS, len(items))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="equipment") as pool:
+        futs = [pool.submit(contextvars.copy_context().run, fn, it) for it in items]
+    return [f.result() for f in futs]
@@ -0,0 +1,245 @@
+import csv
+import io
+import os
+import threading
+import zlib
+from typing import Iterator, Optional
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+from sqlalchemy import select, BigInteger, DateTime, Float, Integer, String
+from sqlalchemy.dialects.mysql import TINYINT
+from .config import settings
+from .db import engine
+from .models import RunView
+from .utils import sha1
+from .versions import data_versions
+
+# (header, column) in export order; headers are what the CSV/XLSX files have always used
+EXPORT_COLUMNS = [
+    ("equipment", RunView.equipment), ("st_time", RunView.st_time), ("sp_time", RunView.sp_time),
+    ("duration_s", RunView.duration_s), ("customer", RunView.project_customer), ("project_code", RunView.project_code),
+    ("user", RunView.user), ("prgver", RunView.prgver), ("codever", RunView.codever),
+    ("sample_no", RunView.sample_no), ("voltage", RunView.voltage), ("test_item", RunView.test_item),
+    ("temp", RunView.temp), ("category", RunView.category), ("accessory", RunView.accessory), ("site", RunView.site),
+    ("eng_flag", RunView.eng_flag), ("eng_tag", RunView.eng_tag),
+]
+EXPORT_HEADERS = [h for h, _ in EXPORT_COLUMNS]
+FETCH_ROWS = 5000    # rows per fetch from the server-side cursor
+CHUNK_BYTES = 1 << 16
+XLSX_MAX_ROWS = 1048576 - 1  # Excel sheet limit minus the header row
+PARQUET_ROW_GROUP = 65536    # rows buffered per Parquet row group (and per streamed chunk)
+
+def runs_select(equipment: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None):
+    q = select(*(c for _, c in EXPORT_COLUMNS))
+    if equipment:
+        q = q.where(RunView.equipment == equipment)
+    if start:
+        q = q.where(RunView.st_time >= start)
+    if end:
+        q = q.where(RunView.sp_time < end)
+    return q
+
+def iter_rows(stmt, bind=None) -> Iterator[tuple]:
+    # unbuffered cursor (SSCursor on pymysql): rows arrive as the server produces them, never all at once.
+    # Uses its own connection because the request-scoped session is closed before a streamed body is sent.
+    with (bind or engine).connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=FETCH_ROWS).execute(stmt)
+        for part in result.partitions():
+            yield from part
+
+def iter_csv(rows, gzip: bool = False) -> Iterator[bytes]:
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    z = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None  # wbits 31 = gzip container
+
+    def take():
+        data = buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+        return z.compress(data) if z else data
+
+    w.writerow(EXPORT_HEADERS)
+    for row in rows:
+        w.writerow(row)
+        if buf.tell() >= CHUNK_BYTES:
+            chunk = take()
+            if chunk:
+                yield chunk
+    tail = take()
+    if z:
+        tail += z.flush()
+    if tail:
+        yield tail
+
+def _arrow_type(col) -> pa.DataType:
+    # strings are dictionary-encoded: equipment/customer/version columns repeat a handful of values
+    t = col.type
+    if isinstance(t, String):
+        return pa.dictionary(pa.int32(), pa.string())
+    if isinstance(t, DateTime):
+        return pa.timestamp("s")
+    if isinstance(t, TINYINT):
+        return pa.int8()
+    if isinstance(t, BigInteger):
+        return pa.int64()
+    if isinstance(t, Integer):
+        return pa.int32()
+    if isinstance(t, Float):
+        return pa.float64()
+    raise TypeError(f"no Arrow type for {col}")
+
+def arrow_schema(columns=EXPORT_COLUMNS, metadata: Optional[dict] = None) -> pa.Schema:
+    return pa.schema([pa.field(name, _arrow_type(col)) for name, col in columns], metadata=metadata)
+
+def iter_batches(rows, schema: pa.Schema, batch_rows: int = FETCH_ROWS) -> Iterator[pa.RecordBatch]:
+    # row tuples -> typed record batches of batch_rows rows
+    def batch(buf):
+        cols = list(zip(*buf))
+        return pa.RecordBatch.from_arrays([
+            pa.array(c, pa.string()).dictionary_encode() if pa.types.is_dictionary(f.type) else pa.array(c, f.type)
+            for c, f in zip(cols, schema)
+        ], schema=schema)
+
+    buf = []
+    for row in rows:
+        buf.append(row)
+        if len(buf) >= batch_rows:
+            yield batch(buf)
+            buf = []
+    if buf:
+        yield batch(buf)
+
+class _ChunkSink:
+    # write-only file object for the Arrow/Parquet writers; take() hands out what was written so far
+    def __init__(self):
+        self.parts, self.pos, self.closed = [], 0, False
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+def iter_parquet(rows, columns=EXPORT_COLUMNS, metadata: Optional[dict] = None) -> Iterator[bytes]:
+    # one row group per PARQUET_ROW_GROUP rows, each sent as soon as it is written; footer last
+    schema = arrow_schema(columns, metadata)
+    sink = _ChunkSink()
+    f = pa.PythonFile(sink, mode="w")
+    try:
+        with pq.ParquetWriter(f, schema, compression="zstd") as w:
+            pending, n = [], 0
+            for b in iter_batches(rows, schema):
+                pending.append(b)
+                n += b.num_rows
+                if n >= PARQUET_ROW_GROUP:
+                    w.write_table(pa.Table.from_batches(pending, schema))
+                    pending, n = [], 0
+                    yield sink.take()
+            if pending:
+                w.write_table(pa.Table.from_batches(pending, schema))
+    finally:
+        f.close()
+    yield sink.take()
+
+def iter_arrow(rows, columns=EXPORT_COLUMNS) -> Iterator[bytes]:
+    # Arrow IPC stream: one message per fetched batch, dictionaries re-sent as they change
+    schema = arrow_schema(columns)
+    sink = _ChunkSink()
+    f = pa.PythonFile(sink, mode="w")
+    try:
+        with pa.ipc.new_stream(f, schema) as w:
+            yield sink.take()
+            for b in iter_batches(rows, schema):
+                w.write_batch(b)
+                yield sink.take()
+    finally:
+        f.close()
+    tail = sink.take()
+    if tail:
+        yield tail
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        if name.strip().lower() not in ("gzip", "*"):
+            continue
+        params = params.strip()
+        try:
+            return not params.startswith("q=") or float(params[2:]) > 0
+        except ValueError:
+            return True
+    return False
+
+def write_xlsx(rows, path: str):
+    # write-only workbook: rows go straight to the sheet XML, nothing is kept per cell
+    wb = Workbook(write_only=True)
+    ws, n, sheets = None, XLSX_MAX_ROWS, 0
+    for row in rows:
+        if n >= XLSX_MAX_ROWS:
+            sheets += 1
+            ws = wb.create_sheet("records" if sheets == 1 else f"records_{sheets}")
+            ws.append(EXPORT_HEADERS)
+            n = 0
+        ws.append(tuple(row))
+        n += 1
+    if ws is None:
+        wb.create_sheet("records").append(EXPORT_HEADERS)
+    wb.save(path)
+
+def _evict(keep: str):
+    # LRU by mtime (cache hits touch the file) until the directory fits the budget
+    budget = settings.EXPORT_CACHE_MB * 1024 * 1024
+    files = []
+    for name in os.listdir(settings.EXPORT_DIR):
+        if name.startswith("records-") and name.endswith(".xlsx"):
+            path = os.path.join(settings.EXPORT_DIR, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= budget:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def cached_xlsx(equipment: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None) -> str:
+    # one file per (filters, data version); read the version before the rows so a file is never
+    # labelled newer than its content
+    with engine.connect() as conn:
+        versions = sorted(data_versions(conn, equipment).items())
+    key = sha1(repr((equipment, start, end, versions)))[:20]
+    path = os.path.join(settings.EXPORT_DIR, f"records-{key}.xlsx")
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+    os.makedirs(settings.EXPORT_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        write_xlsx(iter_rows(runs_select(equipment, start, end)), tmp)
+        os.replace(tmp, path)  # concurrent builders of the same key just overwrite each other
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    _evict(keep=path)
+    return path
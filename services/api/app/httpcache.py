@@ -0,0 +1,133 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Dict, Optional
+import orjson
+from fastapi import Request, Response
+from .config import settings
+from .utils import TPE
+from .versions import version_info
+from . import telemetry
+
+# Conditional GET and result caching keyed on data_versions: a response is identified by
+# (path, query, version of every equipment it covers). ETag / Last-Modified come from that,
+# so a client re-polling unchanged data gets a 304 after one primary-key lookup.
+
+class ResponseCache:
+    """LRU of rendered bodies, each expiring after `ttl` seconds.
+
+    Keys carry the versions, so a stale body is never served; entries also remember their
+    equipment and are dropped as soon as a newer version of one of them is seen.
+    """
+    def __init__(self, entries: int, ttl: float):
+        self.entries, self.ttl = entries, ttl
+        self._data: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (expires, equipment, body)
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, versions: Dict[str, int]):
+        with self._lock:
+            changed = set()
+            for e, v in versions.items():
+                old = self._seen.get(e)
+                if old is None or v > old:
+                    self._seen[e] = v
+                    if old is not None:
+                        changed.add(e)
+            if changed:
+                for k in [k for k, (_, equip, _) in self._data.items() if changed.intersection(equip)]:
+                    del self._data[k]
+
+    def get(self, key) -> Optional[bytes]:
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            if hit[0] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return hit[2]
+
+    def put(self, key, equipment, body: bytes):
+        if self.entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, frozenset(equipment), body)
+            self._data.move_to_end(key)
+            while len(self._data) > self.entries:
+                self._data.popitem(last=False)
+
+CACHE = ResponseCache(settings.RESPONSE_CACHE_ENTRIES, settings.RESPONSE_CACHE_TTL_S)
+
+def _http_date(at: datetime) -> str:
+    return format_datetime(at.replace(tzinfo=TPE, microsecond=0).astimezone(timezone.utc), usegmt=True)
+
+def _opaque(tag: str) -> str:
+    # weak comparison (RFC 9110 8.8.3.2)
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+LAST_MODIFIED_SETTLE = timedelta(seconds=2)
+
+class Conditional:
+    """Validators of one request; `equipment` None means the answer covers every equipment."""
+    def __init__(self, request: Request, db, equipment: Optional[str] = None):
+        info = version_info(db, equipment)
+        self.request = request
+        self.versions = {e: v for e, (v, _) in info.items()}
+        self.key = (request.url.path, tuple(sorted(request.query_params.multi_items())),
+                    tuple(sorted(self.versions.items())))
+        self.etag = 'W/"%s"' % hashlib.sha1(repr(self.key).encode()).hexdigest()[:24]
+        stamps = [at for _, at in info.values() if at is not None]
+        self.last_modified = None
+        # an HTTP date has whole seconds: until that second (plus the bump-to-commit lag) is over,
+        # another change could still carry the same date, so no Last-Modified is sent or honoured yet
+        if stamps and datetime.now(TPE).replace(tzinfo=None) - max(stamps) >= LAST_MODIFIED_SETTLE:
+            self.last_modified = max(stamps).replace(microsecond=0)
+        self.headers = {"ETag": self.etag, "Cache-Control": "no-cache"}
+        if self.last_modified:
+            self.headers["Last-Modified"] = _http_date(self.last_modified)
+        CACHE.observe(self.versions)
+
+    def fresh(self) -> bool:
+        # If-None-Match wins over If-Modified-Since when both are sent: the version is exact, while
+        # updated_at (and HTTP dates) only have whole seconds
+        h = self.request.headers
+        inm = h.get("if-none-match")
+        if inm is not None:
+            return inm.strip() == "*" or _opaque(self.etag) in {_opaque(t) for t in inm.split(",")}
+        ims = h.get("if-modified-since")
+        if ims and self.last_modified:
+            try:
+                since = parsedate_to_datetime(ims)
+            except (TypeError, ValueError):
+                return False
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=timezone.utc)
+            return self.last_modified.replace(tzinfo=TPE) <= since
+        return False
+
+    def not_modified(self) -> Optional[Response]:
+        if not self.fresh():
+            return None
+        telemetry.observe_cache(self.request.scope, "not_modified")
+        return Response(status_code=304, headers=self.headers)
+
+def cached_json(request: Request, db, equipment: Optional[str], build: Callable) -> Response:
+    # 304 when the client is current, else the cached body for these versions, else build() once
+    cond = Conditional(request, db, equipment)
+    resp = cond.not_modified()
+    if resp is not None:
+        return resp
+    body = CACHE.get(cond.key)
+    if body is None:
+        body = orjson.dumps(build(), option=orjson.OPT_SERIALIZE_NUMPY)
+        CACHE.put(cond.key, cond.versions, body)
+        telemetry.observe_cache(request.scope, "miss")
+    else:
+        telemetry.observe_cache(request.scope, "hit")
+    return Response(content=body, media_type="application/json", headers=cond.headers)
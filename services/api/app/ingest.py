@@ -1,152 +1,413 @@
-import os, io
-from datetime import datetime
+import os, io, hashlib, time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
 from typing import Optional, List, Tuple, Dict
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import select, insert, update
 from dateutil import tz
-from .models import RawLog, Run, IngestionState
-from .utils import parse_time, sha1
-from .parsers import parse_keyvals, split_project, parse_logname
+from .config import settings
+from .models import RawLog, Run, RunView, IngestionState
+from .utils import parse_time
+from .parsers import parse_keyvals, split_project, parse_logname, parse_total_time
+from .metrics import merge_intervals
+from .versions import bump_version
+from . import dims, readers, telemetry
 
 TPE = tz.gettz("Asia/Taipei")
+HEAD_BYTES = 4096
 
-def _iter_file_lines(path: str):
-    with open(path, "r", encoding="utf-8", errors="ignore") as f:
-        for i, line in enumerate(f, start=1):
-            if line.strip():
-                yield i, line.rstrip("\n")
+def empty_stats() -> Dict:
+    # days: (equipment, day) pairs whose runs were inserted or extended -> metrics to refresh
+    return {"lines":0, "raw_new":0, "raw_dup":0, "runs_new":0, "runs_dups_or_replaced":0, "bytes_skipped":0, "files_skipped":0, "days":[]}
 
-def _normalize_and_hash(equipment: str, kv: Dict[str,str]) -> str:
+def merge_stats(parts) -> Dict:
+    # sum counters, concatenate lists (per-file timings)
+    out = {}
+    for p in parts:
+        for k, v in p.items():
+            out[k] = out.get(k, [] if isinstance(v, list) else 0) + v
+    return out
+
+def _head_sha1(path: str, n: int) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read(n)).hexdigest()
+
+def _file_sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def file_fingerprint(path: str) -> Dict:
+    # manifest columns of a history file; taken before it is parsed, so a later edit is never hidden
+    st = os.stat(path)
+    return dict(file_inode=st.st_ino, file_size=st.st_size, file_mtime_ns=st.st_mtime_ns, content_sha1=_file_sha1(path))
+
+def _unchanged(state: Optional[IngestionState], path: str) -> bool:
+    if state is None or not state.content_sha1:
+        return False
+    st = os.stat(path)
+    if st.st_size != state.file_size:
+        return False
+    if st.st_mtime_ns != state.file_mtime_ns:
+        # touched or copied, maybe with the same bytes: hash it once and remember the new mtime
+        if _file_sha1(path) != state.content_sha1:
+            return False
+        state.file_inode, state.file_mtime_ns = st.st_ino, st.st_mtime_ns
+    return True
+
+def skip_unchanged(db: Session, equipment: str, files: List[str], force: bool = False) -> Tuple[List[str], int]:
+    # (files to ingest, number skipped): a history file whose manifest still matches is not opened
+    if force:
+        return list(files), 0
+    known = {s.source_file: s for s in db.query(IngestionState).filter(IngestionState.equipment==equipment)}
+    todo = [path for path in files if not _unchanged(known.get(path), path)]
+    db.commit()
+    return todo, len(files) - len(todo)
+
+def _resume_point(state: Optional[IngestionState], path: str, st: os.stat_result) -> Tuple[int,int]:
+    # (offset, line_no) to continue from; (0, 0) when the file is new, truncated or rotated
+    if state is None or not state.last_offset:
+        return 0, 0
+    if state.file_inode != st.st_ino or st.st_size < state.last_offset:
+        return 0, 0
+    if state.head_sha1 != _head_sha1(path, min(HEAD_BYTES, state.last_offset)):
+        return 0, 0
+    return state.last_offset, state.last_line_no or 0
+
+def _normalize_and_hash(equipment: str, kv: Dict[str,str]) -> bytes:
+    # sha1 digest, stored as BINARY(20) (raw_logs view shows it as hex)
     st = kv.get("StTime","")
     sp = kv.get("SpTime","")
     proj = kv.get("Project","")
     logn = kv.get("LogName","")
-    return sha1(f"{equipment}|{st}|{sp}|{proj}|{logn}")
+    return hashlib.sha1(f"{equipment}|{st}|{sp}|{proj}|{logn}".encode("utf-8", errors="ignore")).digest()
 
-def ingest_file(db: Session, equipment: str, file_path: str) -> Dict[str,int]:
-    stats = {"lines":0, "raw_new":0, "raw_dup":0, "runs_new":0, "runs_dups_or_replaced":0}
-    now = datetime.now(TPE)
+def _parse_line(equipment: str, file_path: str, line_no: int, line: str, now: datetime) -> Dict:
+    # one raw_logs row (column -> value) for a non-empty log line
+    kv = parse_keyvals(line)
 
-    # 新增：本次匯入的「同一檔」內部雜湊集合，避免同檔重複行在同一交易內互撞
-    seen_hashes = set()
+    # v1 compatibility: fill missing with None
+    user = kv.get("User")
+    prgver = kv.get("PrgVer")
+    codever = kv.get("CodeVer")
+
+    project_raw = kv.get("Project")
+    cust, code = split_project(project_raw)
+
+    ln = kv.get("LogName")
+    pf = parse_logname(ln)
+
+    return dict(
+        equipment=equipment, source_file=file_path, line_no=line_no,
+        st_time=parse_time(kv.get("StTime","")), sp_time=parse_time(kv.get("SpTime","")),
+        total_s=parse_total_time(kv.get("TotalTime")),
+        project_raw=project_raw, project_customer=cust, project_code=code,
+        user=user, prgver=prgver, codever=codever,
+        logname_raw=ln, sample_no=pf["sample_no"], voltage=pf["voltage"], test_item=pf["test_item"],
+        temp=pf["temp"], category=pf["category"], accessory=pf["accessory"], site=pf["site"],
+        eng_flag=pf["eng_flag"], eng_tag=pf["eng_tag"],
+        missing_user=0 if user else 1, missing_prgver=0 if prgver else 1, missing_codever=0 if codever else 1,
+        hash_sig=_normalize_and_hash(equipment, kv), inserted_at=now
+    )
+
+RAW_COLS = [c.name for c in RawLog.__table__.columns if c.name != "id"]
+RUN_INSERT_COLS = [c.name for c in Run.__table__.columns if c.name != "id"]
+
+def _existing_hashes(db: Session, equipment: str, hashes: List[bytes]) -> set:
+    rows = db.execute(
+        select(RawLog.hash_sig).where(RawLog.equipment==equipment, RawLog.hash_sig.in_(hashes))
+    ).all()
+    return {r[0] for r in rows}
+
+def _insert_raw(db: Session, rows: List[Dict]):
+    # executemany; IGNORE turns a concurrent insert of the same hash into a no-op instead of
+    # an IntegrityError that used to roll back the whole file
+    stmt = insert(RawLog.__table__).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+    db.execute(stmt, [{c: r[c] for c in RAW_COLS} for r in rows])
+
+class RunIndex:
+    """Overlap index of one equipment's runs for the duration of an ingest.
+
+    Runs are grouped by the dedup key (customer, project code, sample_no, test_item) and kept
+    sorted by st_time; the longest span seen per key bounds how far back an overlap can start.
+    Runs overlapping a time range are loaded once (ensure) and all inserts/extensions stay in
+    memory until flush().
+    """
+    RUN_COLS = ("id", "st_time", "sp_time", "duration_s", "project_customer", "project_code",
+                "sample_no", "test_item", "source_count", "dedup_status")
+
+    def __init__(self, equipment: str):
+        self.equipment = equipment
+        self.starts: Dict[tuple, List[datetime]] = {}
+        self.entries: Dict[tuple, List[Dict]] = {}
+        self.max_span: Dict[tuple, timedelta] = {}
+        self.loaded_ids = set()
+        self.covered: List[Tuple[datetime, datetime]] = []  # ranges whose runs are all loaded
+        self.new: List[Dict] = []
+        self.changed: Dict[int, Dict] = {}
+        self.dirty: set = set()  # days (00:00) overlapped by inserted/extended runs
+
+    @staticmethod
+    def key(cust, code, sample_no, test_item) -> tuple:
+        # MySQL compares these columns case-insensitively; keep matching the way the SQL filter did
+        return tuple(v.lower() if v is not None else None for v in (cust, code, sample_no, test_item))
+
+    def ensure(self, db: Session, lo: datetime, hi: datetime):
+        # shrink [lo, hi] by ranges already loaded, then load every run overlapping the rest;
+        # a record stopping before it starts can hand in a reversed range
+        lo, hi = min(lo, hi), max(lo, hi)
+        for a, b in self.covered:
+            if a <= lo <= b:
+                lo = b
+            if a <= hi <= b:
+                hi = a
+        if lo > hi and self.covered:
+            return
+        cols = [getattr(RunView, c) for c in self.RUN_COLS]
+        rows = db.execute(select(*cols).where(
+            RunView.equipment==self.equipment, RunView.st_time <= hi, RunView.sp_time >= lo
+        )).all()
+        for row in rows:
+            if row.id in self.loaded_ids:
+                continue
+            self.loaded_ids.add(row.id)
+            e = dict(zip(self.RUN_COLS, row))
+            self._insert(self.key(e["project_customer"], e["project_code"], e["sample_no"], e["test_item"]), e)
+        self.covered = merge_intervals(self.covered + [(lo, hi)])
+
+    def _insert(self, k: tuple, e: Dict):
+        starts = self.starts.setdefault(k, [])
+        i = bisect_right(starts, e["st_time"])
+        starts.insert(i, e["st_time"])
+        self.entries.setdefault(k, []).insert(i, e)
+        span = e["sp_time"] - e["st_time"]
+        if span > self.max_span.get(k, timedelta(0)):
+            self.max_span[k] = span
 
-    for line_no, line in _iter_file_lines(file_path):
-        stats["lines"] += 1
-        kv = parse_keyvals(line)
-
-        # v1 compatibility: fill missing with None
-        user = kv.get("User")
-        prgver = kv.get("PrgVer")
-        codever = kv.get("CodeVer")
-        missing_user = 0 if user else 1
-        missing_prgver = 0 if prgver else 1
-        missing_codever = 0 if codever else 1
-
-        st = parse_time(kv.get("StTime",""))
-        sp = parse_time(kv.get("SpTime",""))
-        total_s = None
-        if "TotalTime" in kv:
-            t = kv["TotalTime"].rstrip("s")
-            try:
-                total_s = int(float(t))
-            except:
-                total_s = None
-
-        project_raw = kv.get("Project")
-        cust, code = split_project(project_raw)
-
-        ln = kv.get("LogName")
-        pf = parse_logname(ln)
-
-        h = _normalize_and_hash(equipment, kv)
-        
-        # 新增：同檔即時去重（不用等到 commit）
-        if h in seen_hashes:
+    def _remove(self, k: tuple, e: Dict):
+        starts, entries = self.starts[k], self.entries[k]
+        i = bisect_left(starts, e["st_time"])
+        while entries[i] is not e:
+            i += 1
+        del starts[i], entries[i]
+
+    def overlapping(self, k: tuple, st: datetime, sp: datetime) -> List[Dict]:
+        # any overlap: run.st_time <= sp and run.sp_time >= st
+        starts = self.starts.get(k)
+        if not starts:
+            return []
+        lo = bisect_left(starts, st - self.max_span[k])
+        hi = bisect_right(starts, sp)
+        return [e for e in self.entries[k][lo:hi] if e["sp_time"] >= st]
+
+    def touch(self, st: datetime, sp: datetime):
+        # every day the run crosses, start day through end day
+        d = min(st, sp).replace(hour=0, minute=0, second=0, microsecond=0)
+        while d <= max(st, sp):
+            self.dirty.add(d)
+            d += timedelta(days=1)
+
+    def add(self, k: tuple, e: Dict):
+        self._insert(k, e)
+        self.new.append(e)
+        self.touch(e["st_time"], e["sp_time"])
+
+    def extend(self, k: tuple, e: Dict, st: datetime, sp: datetime):
+        self._remove(k, e)
+        e["st_time"] = min(e["st_time"], st)
+        e["sp_time"] = max(e["sp_time"], sp)
+        e["duration_s"] = int((e["sp_time"] - e["st_time"]).total_seconds())
+        e["source_count"] += 1
+        e["dedup_status"] = "replaced"
+        self._insert(k, e)
+        self.touch(e["st_time"], e["sp_time"])  # extended range contains the old one
+        if e.get("id") is not None:
+            self.changed[e["id"]] = e
+
+    def flush(self, db: Session):
+        if self.new:
+            db.execute(insert(Run.__table__), [{c: e[c] for c in RUN_INSERT_COLS} for e in self.new])
+        if self.changed:
+            db.execute(update(Run), [
+                {c: e[c] for c in ("id", "st_time", "sp_time", "duration_s", "source_count", "dedup_status")}
+                for e in self.changed.values()
+            ])
+        self.new, self.changed = [], {}
+
+def _merge_run(index: RunIndex, equipment: str, rec: Dict, stats: Dict[str,int]):
+    st, sp, total_s = rec["st_time"], rec["sp_time"], rec["total_s"]
+    if not (st and sp and total_s is not None):
+        return
+    cust, code = rec["project_customer"], rec["project_code"]
+    # Strict consistency check (±1s tolerance)
+    dur = int(abs((sp - st).total_seconds()))
+    consistent = abs(dur - int(total_s)) <= 1
+    # Composite key: equip + project + sample + test item, any time overlap
+    k = index.key(cust, code, rec["sample_no"], rec["test_item"])
+    candidates = index.overlapping(k, st, sp)
+
+    if candidates:
+        # same record different time? choose the one with max(duration)
+        best = max(candidates, key=lambda x: x["duration_s"])
+        if total_s > best["duration_s"]:
+            # Replace: update best (longer_duration_preferred)
+            index.extend(k, best, st, sp)
+        stats["runs_dups_or_replaced"] += 1
+        return
+
+    index.add(k, dict(
+        equipment=equipment, st_time=st, sp_time=sp,
+        duration_s=dur if consistent else int(total_s),
+        project_customer=cust, project_code=code, sample_no=rec["sample_no"], test_item=rec["test_item"],
+        project_id=rec["project_id"], meta_id=rec["meta_id"], logname_id=rec["logname_id"],
+        source_count=1, dedup_status="kept", conflict_reason=None if consistent else "time_mismatch"
+    ))
+    stats["runs_new"] += 1
+
+def _write_batch(db: Session, index: RunIndex, batch: List[Dict], seen_hashes: set, stats: Dict[str,int],
+                 timings: Dict[str,float]):
+    equipment = index.equipment
+    t0 = time.perf_counter()
+    # 同檔即時去重 + 一次 IN (...) 查詢既有雜湊（避免跨檔/歷史重複）
+    fresh = []
+    for rec in batch:
+        if rec["hash_sig"] in seen_hashes:
             stats["raw_dup"] += 1
             continue
-        
-        # 原本的資料庫層級去重（避免跨檔/歷史重複）
-        exists = db.query(RawLog.id).filter(
-            RawLog.equipment==equipment, RawLog.hash_sig==h
+        seen_hashes.add(rec["hash_sig"])
+        fresh.append(rec)
+    existing = _existing_hashes(db, equipment, [r["hash_sig"] for r in fresh]) if fresh else set()
+    new = [r for r in fresh if r["hash_sig"] not in existing]
+    stats["raw_dup"] += len(fresh) - len(new)
+    stats["raw_new"] += len(new)
+    t1 = time.perf_counter()
+    timings["dedup"] += t1 - t0
+    if not new:
+        return
+    dims.attach(db, new)
+    _insert_raw(db, new)
+    t2 = time.perf_counter()
+    timings["insert"] += t2 - t1
+    timed = [r for r in new if r["st_time"] and r["sp_time"]]
+    if timed:
+        index.ensure(db, min(r["st_time"] for r in timed), max(r["sp_time"] for r in timed))
+    for rec in new:
+        _merge_run(index, equipment, rec, stats)
+    timings["merge"] += time.perf_counter() - t2
+
+def iter_record_batches(equipment: str, file_path: str, offset: int = 0, start_line: int = 0,
+                        now: Optional[datetime] = None, batch_size: Optional[int] = None,
+                        timings: Optional[Dict[str,float]] = None,
+                        read_info: Optional[Dict] = None, partial: bool = True):
+    # parse stage (no DB access): yields (records, lines, resume_offset, resume_line_no) per batch,
+    # where the resume point is right after the last complete line read so far.
+    # partial: also parse a last line without newline (closed history files); when False it is left
+    # out, so a line the tester is still writing goes in once, when it is complete
+    # timings["parse"] accumulates time spent parsing (reading the file excluded);
+    # read_info gets the reader used and its bytes / seconds (readers.iter_lines)
+    now = now or datetime.now(TPE)
+    batch_size = batch_size or settings.INGEST_BATCH_SIZE
+    timings = {"parse": 0.0} if timings is None else timings
+    last_offset, last_line_no = offset, start_line
+    batch, lines = [], 0
+    clock = time.perf_counter
+    for line_no, line, end_offset, complete in readers.iter_lines(file_path, offset, start_line, read_info):
+        if not complete and not partial:
+            break
+        lines += 1
+        if complete:
+            last_offset, last_line_no = end_offset, line_no
+        t = clock()
+        batch.append(_parse_line(equipment, file_path, line_no, line, now))
+        timings["parse"] += clock() - t
+        if len(batch) >= batch_size:
+            yield batch, lines, last_offset, last_line_no
+            batch, lines = [], 0
+    yield batch, lines, last_offset, last_line_no
+
+def ingest_file(db: Session, equipment: str, file_path: str, incremental: bool = False, batches=None,
+                progress=None, manifest: Optional[Dict] = None) -> Dict[str,int]:
+    # batches: records already produced by iter_record_batches (e.g. in a worker process, which then
+    # reports the read/parse stages itself)
+    # manifest: file_fingerprint() of the file as read; stored with the row counts in the same commit
+    # progress: optional callback(equipment, file_path, lines, offset), at start and after each batch
+    stats = empty_stats()
+    now = datetime.now(TPE)
+    t_start = time.perf_counter()
+    timings = telemetry.stage_timer()
+
+    # incremental: resume after the last committed line recorded in ingestion_state
+    state = None
+    offset, start_line = 0, 0
+    if incremental:
+        fst = os.stat(file_path)
+        state = db.query(IngestionState).filter(
+            IngestionState.equipment==equipment, IngestionState.source_file==file_path
         ).first()
-        if exists:
-            stats["raw_dup"] += 1
-            continue
+        offset, start_line = _resume_point(state, file_path, fst)
+        stats["bytes_skipped"] = offset
+    last_offset, last_line_no = offset, start_line
+    produce = batches is None
+    read_info = {}
+    if produce:
+        batches = iter_record_batches(equipment, file_path, offset, start_line, now, timings=timings,
+                                      read_info=read_info, partial=not incremental)
 
-        r = RawLog(
-            equipment=equipment, source_file=file_path, line_no=line_no,
-            st_time=st, sp_time=sp, total_s=total_s,
-            project_raw=project_raw, project_customer=cust, project_code=code,
-            user=user, prgver=prgver, codever=codever,
-            logname_raw=ln, sample_no=pf["sample_no"], voltage=pf["voltage"], test_item=pf["test_item"],
-            temp=pf["temp"], category=pf["category"], accessory=pf["accessory"], site=pf["site"],
-            eng_flag=pf["eng_flag"], eng_tag=pf["eng_tag"],
-            missing_user=missing_user, missing_prgver=missing_prgver, missing_codever=missing_codever,
-            hash_sig=h, inserted_at=now
-        )
-        db.add(r)
-        stats["raw_new"] += 1
-        seen_hashes.add(h)
-
-        # Dedup & upsert Run
-        if st and sp and total_s is not None:
-            # Strict consistency check (±1s tolerance)
-            dur = int(abs((sp - st).total_seconds()))
-            consistent = abs(dur - int(total_s)) <= 1
-            # Composite key: equip + times + project + logname
-            # We allow ±1s tolerance on times; we implement by exact match first; else search small window
-            q = db.query(Run).filter(
-                Run.equipment==equipment,
-                Run.project_customer==cust,
-                Run.project_code==code,
-                Run.sample_no==pf["sample_no"],
-                Run.test_item==pf["test_item"],
-            )
-            candidates = q.filter(
-                and_(Run.st_time <= sp, Run.sp_time >= st)  # any overlap
-            ).all()
-
-            kept = True
-            reason = None
-            if candidates:
-                # same record different time? choose the one with max(duration)
-                best = max(candidates, key=lambda x: x.duration_s)
-                if total_s > best.duration_s:
-                    # Replace: update best
-                    best.st_time = min(best.st_time, st)
-                    best.sp_time = max(best.sp_time, sp)
-                    best.duration_s = int((best.sp_time - best.st_time).total_seconds())
-                    best.source_count += 1
-                    best.dedup_status = "replaced"
-                    reason = "longer_duration_preferred"
-                    kept = False
-                    stats["runs_dups_or_replaced"] += 1
-                else:
-                    kept = False
-                    stats["runs_dups_or_replaced"] += 1
-
-            if kept:
-                run = Run(
-                    equipment=equipment, st_time=st, sp_time=sp,
-                    duration_s=dur if consistent else int(total_s),
-                    project_customer=cust, project_code=code,
-                    user=user, prgver=prgver, codever=codever,
-                    sample_no=pf["sample_no"], voltage=pf["voltage"],
-                    test_item=pf["test_item"], temp=pf["temp"],
-                    category=pf["category"], accessory=pf["accessory"],
-                    site=pf["site"], eng_flag=pf["eng_flag"], eng_tag=pf["eng_tag"],
-                    source_count=1, dedup_status="kept", conflict_reason=None if consistent else "time_mismatch"
-                )
-                db.add(run)
-                stats["runs_new"] += 1
-
-    # 新增：穩健 commit，若極少數情況仍因競態撞到唯一鍵，回滾後繼續
-    try:
-        db.commit()
-    except IntegrityError:
-        db.rollback()
-        # 這裡不再重試插入，讓重複視為 raw_dup；下次再跑也會被 exists 擋掉
+    # 本次匯入的「同一檔」內部雜湊集合，避免同檔重複行互撞
+    seen_hashes = set()
+    index = RunIndex(equipment)
+    if progress:
+        progress(equipment, file_path, 0, offset)
+    t_write = 0.0
+    for batch, lines, last_offset, last_line_no in batches:
+        t = time.perf_counter()
+        stats["lines"] += lines
+        _write_batch(db, index, batch, seen_hashes, stats, timings)
+        if progress:
+            progress(equipment, file_path, stats["lines"], last_offset)
+        t_write += time.perf_counter() - t
+    t = time.perf_counter()
+    index.flush(db)
+    timings["merge"] += time.perf_counter() - t
+    if produce:  # whatever the loop spent outside writing was reading + parsing
+        timings["read"] = max(0.0, t - t_start - t_write - timings["parse"])
+    else:
+        del timings["read"], timings["parse"]
+    stats["days"] = [(equipment, d) for d in sorted(index.dirty)]
+
+    if manifest is not None and state is None:
+        state = db.query(IngestionState).filter(
+            IngestionState.equipment==equipment, IngestionState.source_file==file_path
+        ).first()
+    if incremental or manifest is not None:
+        if state is None:
+            state = IngestionState(equipment=equipment, source_file=file_path)
+            db.add(state)
+        state.last_ingested_at = now.replace(tzinfo=None)
+    if manifest is not None:
+        for k, v in manifest.items():
+            setattr(state, k, v)
+        state.lines, state.raw_new, state.raw_dup = stats["lines"], stats["raw_new"], stats["raw_dup"]
+        state.ingest_s = round(time.perf_counter() - t_start, 3)
+    if incremental:
+        state.file_inode = fst.st_ino
+        state.file_size = fst.st_size
+        state.file_mtime_ns = fst.st_mtime_ns
+        state.last_offset = last_offset
+        state.last_line_no = last_line_no
+        state.head_sha1 = _head_sha1(file_path, min(HEAD_BYTES, last_offset))
+
+    t = time.perf_counter()
+    if stats["raw_new"]:
+        bump_version(db, equipment)  # runs only change when new raw lines came in
+    db.commit()
+    done = time.perf_counter()
+    timings["commit"] = done - t
+    telemetry.observe_file(equipment, stats, done - t_start, timings)
+    if read_info:
+        telemetry.observe_read(read_info)
     return stats
 
 def find_month_file(root_dir: str, year: int, month: int) -> Optional[str]:
@@ -154,22 +415,32 @@ def find_month_file(root_dir: str, year: int, month: int) -> Optional[str]:
     cand = os.path.join(root_dir, f"{yyyymm}_total_run_time.txt")
     return cand if os.path.isfile(cand) else None
 
-def ingest_current_month(db: Session, equipment: str, root_dir: str) -> Dict[str,int]:
+def ingest_current_month(db: Session, equipment: str, root_dir: str, progress=None) -> Dict[str,int]:
     now = datetime.now(TPE)
     f = find_month_file(root_dir, now.year, now.month)
     if not f:
-        return {"lines":0,"raw_new":0,"raw_dup":0,"runs_new":0,"runs_dups_or_replaced":0}
-    return ingest_file(db, equipment, f)
+        return empty_stats()
+    return ingest_file(db, equipment, f, incremental=True, progress=progress)
 
-def ingest_historical(db: Session, equipment: str, root_dir: str, hist_dir_name: str = "S100_test_log"):
+def list_history_files(root_dir: str, hist_dir_name: str = "S100_test_log") -> List[str]:
+    # chronological (YYYYMM_ prefix) order; run merging depends on it
     hist_dir = os.path.join(root_dir, hist_dir_name)
-    stats_total = {"lines":0, "raw_new":0, "raw_dup":0, "runs_new":0, "runs_dups_or_replaced":0}
     if not os.path.isdir(hist_dir):
-        return stats_total
-    for name in sorted(os.listdir(hist_dir)):
-        if name.endswith("_total_run_time.txt"):
-            path = os.path.join(hist_dir, name)
-            st = ingest_file(db, equipment, path)
-            for k,v in st.items():
-                stats_total[k] += v
+        return []
+    # a month compressed next to its original (.gz/.bz2/.zst) is read once, from the plain file
+    months = {}
+    for name in sorted(os.listdir(hist_dir), reverse=True):
+        if readers.is_log_file(name):
+            months[readers.month_key(name)] = name
+    return [os.path.join(hist_dir, months[m]) for m in sorted(months)]
+
+def ingest_historical(db: Session, equipment: str, root_dir: str, hist_dir_name: str = "S100_test_log",
+                      force: bool = False):
+    # force: re-read every file even when its manifest says it is unchanged
+    stats_total = empty_stats()
+    files, stats_total["files_skipped"] = skip_unchanged(db, equipment, list_history_files(root_dir, hist_dir_name), force)
+    for path in files:
+        st = ingest_file(db, equipment, path, manifest=file_fingerprint(path))
+        for k,v in st.items():
+            stats_total[k] += v
     return stats_total
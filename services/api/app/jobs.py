@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Optional
+from .config import settings
+from .utils import TPE
+from . import readers, telemetry
+
+# In-process ingest job queue: POST enqueues and returns at once, a bounded pool runs the jobs,
+# GET polls per-file progress. Jobs live in memory only (one API process).
+KEEP_FINISHED = 100
+
+_lock = threading.Lock()
+_jobs: "OrderedDict[str, Dict]" = OrderedDict()
+_pool: Optional[ThreadPoolExecutor] = None
+_equipment_locks: Dict[str, threading.Lock] = {}  # jobs touching the same equipment never overlap
+
+def _now() -> str:
+    return datetime.now(TPE).replace(tzinfo=None).isoformat(timespec="seconds")
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=settings.INGEST_JOB_WORKERS, thread_name_prefix="ingest-job")
+    return _pool
+
+class Progress:
+    # passed to ingest_file(progress=...): called once when a file starts and after every batch
+    def __init__(self, job: Dict):
+        self.job = job
+        self.t0: Dict[str, tuple] = {}
+
+    def __call__(self, equipment: str, path: str, lines: int, offset: int):
+        now = time.perf_counter()
+        if path not in self.t0:
+            try:
+                # offsets of a .gz/.bz2/.zst file count decompressed bytes: no total, no ETA
+                size = os.path.getsize(path) if readers.reader_name(path) == "plain" else None
+            except OSError:
+                size = None
+            self.t0[path] = (now, offset, size)
+        t0, off0, size = self.t0[path]
+        elapsed = now - t0
+        rate = (offset - off0) / elapsed if elapsed > 0 else 0.0
+        with _lock:
+            self.job["files"][path] = dict(
+                equipment=equipment, lines=lines, bytes_done=offset, bytes_total=size,
+                lines_per_s=round(lines / elapsed, 1) if elapsed > 0 else None,
+                eta_s=round((size - offset) / rate, 1) if size is not None and rate > 0 else None,
+                elapsed_s=round(elapsed, 2),
+            )
+
+def submit(kind: str, equipment: tuple, fn: Callable[[Progress], Dict]) -> Dict:
+    # a queued/running job of the same kind for the same equipment absorbs the new submission
+    with _lock:
+        for job in _jobs.values():
+            if job["kind"] == kind and job["equipment"] == list(equipment) and job["status"] in ("queued", "running"):
+                job["coalesced"] += 1
+                return dict(job)
+        job = dict(id=uuid.uuid4().hex[:12], kind=kind, equipment=list(equipment), status="queued",
+                   submitted_at=_now(), started_at=None, finished_at=None, coalesced=0,
+                   files={}, result=None, error=None)
+        _jobs[job["id"]] = job
+        finished = [k for k, j in _jobs.items() if j["status"] in ("done", "failed")]
+        for k in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+            del _jobs[k]
+    _get_pool().submit(_run, job, fn)
+    return dict(job)
+
+def _run(job: Dict, fn: Callable[[Progress], Dict]):
+    telemetry.set_job(job["kind"])  # SQL issued by this job is labelled job:<kind>
+    with _lock:
+        locks = [_equipment_locks.setdefault(e, threading.Lock()) for e in sorted(job["equipment"])]
+    for lk in locks:
+        lk.acquire()
+    try:
+        with _lock:
+            job["status"], job["started_at"] = "running", _now()
+        t0 = time.perf_counter()
+        try:
+            result, status, error = fn(Progress(job)), "done", None
+        except Exception:
+            result, status, error = None, "failed", traceback.format_exc(limit=5)
+        telemetry.observe_job(job["kind"], job["equipment"], status, time.perf_counter() - t0)
+    finally:
+        for lk in reversed(locks):
+            lk.release()
+    with _lock:
+        job.update(status=status, result=result, error=error, finished_at=_now())
+
+def get_job(job_id: str) -> Optional[Dict]:
+    with _lock:
+        job = _jobs.get(job_id)
+        return None if job is None else dict(job, files=dict(job["files"]))
+
+def list_jobs() -> list:
+    with _lock:
+        return [dict(j, files=dict(j["files"]), result=None) for j in reversed(_jobs.values())]
+
+def shutdown():
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
@@ -1,7 +1,14 @@
 from datetime import datetime, timedelta
+import numpy as np
 from typing import List, Tuple
-from .models import Run, DailyMetrics
+from .models import Run, RunView, DailyMetrics, ProjectDailyRollup
+from sqlalchemy import select, func, insert, delete
 from sqlalchemy.orm import Session
+from .db import upsert
+from .versions import bump_version
+from .config import settings
+
+DAY = timedelta(days=1)
 
 def merge_intervals(intervals: List[Tuple[datetime, datetime]]) -> List[Tuple[datetime, datetime]]:
     if not intervals:
@@ -16,33 +23,227 @@ def merge_intervals(intervals: List[Tuple[datetime, datetime]]) -> List[Tuple[da
             merged.append(cur)
     return merged
 
-def compute_daily_metrics(db: Session, day: datetime, equipment: str):
-    # Day boundaries in local tz (assume already localized at 00:00)
-    start = day
-    end = day + timedelta(days=1)
-
-    runs = (
-        db.query(Run)
-          .filter(Run.equipment == equipment, Run.st_time < end, Run.sp_time > start)
-          .all()
-    )
-    # Clip to day window
-    intervals = []
-    for r in runs:
-        a = max(r.st_time, start)
-        b = min(r.sp_time, end)
-        if a < b:
-            intervals.append((a,b))
-
-    merged = merge_intervals(intervals)
-    busy_s = sum(int((b-a).total_seconds()) for a,b in merged)
-    util = (busy_s / 86400.0) * 100.0
-    dm = DailyMetrics(
-        equipment=equipment, day=start, busy_time_s=busy_s,
-        utilization_24h_pct=util, records_count=len(runs)
-    )
-    # Upsert-like: delete existing for (equipment, day) then add
-    db.query(DailyMetrics).filter(DailyMetrics.equipment==equipment, DailyMetrics.day==start).delete()
-    db.add(dm)
+MINUTES = 1440
+EMPTY_BITMAP = bytes(MINUTES // 8)
+
+def _add_minutes(acc, s0: int, s1: int):
+    # add busy seconds [s0, s1) of a day into per-minute totals
+    m0, r0 = divmod(s0, 60)
+    m1, r1 = divmod(s1, 60)
+    if m0 == m1:
+        acc[m0] += s1 - s0
+        return
+    acc[m0] += 60 - r0
+    acc[m0 + 1:m1] += 60
+    if r1:
+        acc[m1] += r1
+
+def _day_index(t: datetime, start: datetime) -> int:
+    return (t - start) // DAY
+
+def compute_metrics_range(db: Session, equipment: str, start_day: datetime, end_day: datetime,
+                          commit: bool = True) -> List[dict]:
+    # every day in [start_day, end_day) from one ordered query: runs are merged in a single sweep and
+    # the merged intervals split at midnight; same numbers as running compute_daily_metrics per day
+    start = start_day.replace(hour=0, minute=0, second=0, microsecond=0)
+    n = max(0, -(-(end_day - start) // DAY))
+    end = start + n * DAY
+    if n == 0:
+        return []
+    rows = db.execute(
+        select(Run.st_time, Run.sp_time)
+        .where(Run.equipment == equipment, Run.st_time < end, Run.sp_time > start)
+        .order_by(Run.st_time)
+    ).all()
+
+    busy = [0] * n
+    counts = [0] * (n + 1)  # difference array: a run counts on every day it overlaps
+    minutes = {}  # day index -> busy seconds per minute of the day
+
+    def spread(a, b):
+        i = _day_index(a, start)
+        while a < b:
+            day0 = start + i * DAY
+            cut = min(b, day0 + DAY)
+            busy[i] += int((cut - a).total_seconds())
+            _add_minutes(minutes.setdefault(i, np.zeros(MINUTES, dtype=np.int16)),
+                         int((a - day0).total_seconds()), int((cut - day0).total_seconds()))
+            a, i = cut, i + 1
+
+    cur = None
+    for st, sp in rows:
+        first = max(_day_index(st, start), 0)
+        last = min(_day_index(sp - timedelta(microseconds=1), start), n - 1)
+        if first <= last:
+            counts[first] += 1
+            counts[last + 1] -= 1
+        a, b = max(st, start), min(sp, end)
+        if a >= b:
+            continue
+        if cur and a <= cur[1]:
+            cur[1] = max(cur[1], b)
+        else:
+            if cur:
+                spread(*cur)
+            cur = [a, b]
+    if cur:
+        spread(*cur)
+
+    out, running = [], 0
+    for i in range(n):
+        running += counts[i]
+        m = minutes.get(i)
+        out.append(dict(equipment=equipment, day=start + i * DAY, busy_time_s=busy[i],
+                        utilization_24h_pct=(busy[i] / 86400.0) * 100.0, records_count=running,
+                        busy_bitmap=EMPTY_BITMAP if m is None else np.packbits(m >= 30).tobytes()))
+    for i in range(0, n, 1000):
+        upsert(db, DailyMetrics.__table__, out[i:i + 1000], ["equipment", "day"])
+    bump_version(db, equipment)
+    if commit:
+        db.commit()
+    return out
+
+def compute_rollups_range(db: Session, equipment: str, start_day: datetime, end_day: datetime,
+                          commit: bool = True) -> List[dict]:
+    # rollup_project_daily for [start_day, end_day): duration/count go to the run's start day (so sums
+    # over days never double count), busy seconds are merged per group and split at midnight
+    start = start_day.replace(hour=0, minute=0, second=0, microsecond=0)
+    n = max(0, -(-(end_day - start) // DAY))
+    end = start + n * DAY
+    if n == 0:
+        return []
+    rows = db.execute(
+        select(RunView.st_time, RunView.sp_time, RunView.duration_s, RunView.project_customer,
+               RunView.project_code, RunView.eng_flag)
+        .where(RunView.equipment == equipment, RunView.st_time < end, RunView.sp_time > start)
+        .order_by(RunView.st_time)
+    ).all()
+
+    names, cur, agg = {}, {}, {}
+
+    def cell(k, i):
+        c = agg.get((k, i))
+        if c is None:
+            cust, code, eng = names[k]
+            c = agg[(k, i)] = dict(equipment=equipment, day=start + i * DAY, project_customer=cust,
+                                   project_code=code, eng_flag=eng, duration_s=0, runs_count=0, busy_s=0)
+        return c
+
+    def spread(k, a, b):
+        i = _day_index(a, start)
+        while a < b:
+            cut = min(b, start + (i + 1) * DAY)
+            cell(k, i)["busy_s"] += int((cut - a).total_seconds())
+            a, i = cut, i + 1
+
+    for st, sp, dur, cust, code, eng in rows:
+        cust, code, eng = cust or "", code or "", eng or 0
+        k = (cust.lower(), code.lower(), eng)  # same grouping as the case-insensitive unique key
+        names.setdefault(k, (cust, code, eng))
+        if st >= start:
+            c = cell(k, _day_index(st, start))
+            c["duration_s"] += dur or 0
+            c["runs_count"] += 1
+        a, b = max(st, start), min(sp, end)
+        if a >= b:
+            continue
+        iv = cur.get(k)
+        if iv and a <= iv[1]:
+            iv[1] = max(iv[1], b)
+        else:
+            if iv:
+                spread(k, *iv)
+            cur[k] = [a, b]
+    for k, iv in cur.items():
+        spread(k, *iv)
+
+    out = sorted(agg.values(), key=lambda r: r["day"])
+    db.execute(delete(ProjectDailyRollup).where(ProjectDailyRollup.equipment == equipment,
+                                                ProjectDailyRollup.day >= start, ProjectDailyRollup.day < end))
+    for i in range(0, len(out), 1000):
+        db.execute(insert(ProjectDailyRollup.__table__), out[i:i + 1000])
+    bump_version(db, equipment)
+    if commit:
+        db.commit()
+    return out
+
+def refresh_days(db: Session, days) -> List[Tuple[str, datetime]]:
+    # days: (equipment, day) pairs from ingest stats; each run of consecutive days is one range
+    # computation, all committed together
+    done = sorted(set(days))
+    i = 0
+    while i < len(done):
+        equip, first = done[i]
+        j = i
+        while j + 1 < len(done) and done[j + 1] == (equip, done[j][1] + DAY):
+            j += 1
+        compute_metrics_range(db, equip, first, done[j][1] + DAY, commit=False)
+        compute_rollups_range(db, equip, first, done[j][1] + DAY, commit=False)
+        i = j + 1
     db.commit()
-    return dm
+    return done
+
+def runs_span(db: Session, equipment: str):
+    # (first day, day after the last) covered by an equipment's runs, or None
+    lo, hi = db.execute(select(func.min(Run.st_time), func.max(Run.sp_time)).where(Run.equipment == equipment)).one()
+    if lo is None:
+        return None
+    return lo.replace(hour=0, minute=0, second=0, microsecond=0), hi
+
+def parse_windows(spec: str) -> List[Tuple[str, int, int]]:
+    # "08:00-20:00" or "day=08:00-20:00,night=20:00-08:00" -> [(label, start_min, end_min)];
+    # end <= start means the window runs past midnight into the next day
+    out = []
+    for part in spec.split(","):
+        label, _, rng = part.strip().rpartition("=")
+        a, b = rng.split("-")
+        s, e = (int(h) * 60 + int(m) for h, m in (x.strip().split(":") for x in (a, b)))
+        if not (0 <= s < MINUTES and 0 <= e <= MINUTES):
+            raise ValueError(f"bad window {part!r}")
+        out.append((label or rng.strip(), s, e if e > s else e + MINUTES))
+    return out
+
+def utilization(db: Session, equipment: str, start_day: datetime, end_day: datetime,
+                window: str = None, granularity: str = "day") -> dict:
+    # any time-of-day window from metrics_daily.busy_bitmap: days are laid end to end as one bit
+    # array, a prefix sum of the bits turns each window into two lookups
+    start = start_day.replace(hour=0, minute=0, second=0, microsecond=0)
+    n = max(0, -(-(end_day - start) // DAY))
+    if granularity == "hour":
+        windows = [(f"{h:02d}", h * 60, h * 60 + 60) for h in range(24)]
+        if window:
+            keep = parse_windows(window)
+            windows = [w for w in windows if any(s <= w[1] < e or s <= w[1] + MINUTES < e for _, s, e in keep)]
+    else:
+        windows = parse_windows(window or (settings.SHIFTS if granularity == "shift" else "00:00-24:00"))
+
+    # one extra day for windows that run past midnight
+    rows = db.execute(select(DailyMetrics.day, DailyMetrics.busy_bitmap).where(
+        DailyMetrics.equipment == equipment, DailyMetrics.day >= start, DailyMetrics.day < start + (n + 1) * DAY
+    )).all()
+    bits = np.zeros((n + 1, MINUTES), dtype=np.uint8)
+    no_bitmap = []
+    for day, bm in rows:
+        if bm is None:
+            no_bitmap.append(day.date().isoformat())
+        else:
+            bits[_day_index(day, start)] = np.unpackbits(np.frombuffer(bm, dtype=np.uint8))
+    csum = np.concatenate([[0], np.cumsum(bits.ravel(), dtype=np.int64)])
+
+    out, totals = [], {}
+    for i in range(n):
+        for label, s, e in windows:
+            a, b = i * MINUTES + s, i * MINUTES + e
+            busy_min = int(csum[b] - csum[a])
+            out.append(dict(day=(start + i * DAY).date().isoformat(), window=label, busy_min=busy_min,
+                            minutes=e - s, utilization_pct=round(busy_min * 100.0 / (e - s), 3)))
+            t = totals.setdefault(label, [0, 0])
+            t[0] += busy_min
+            t[1] += e - s
+    summary = [dict(window=label, busy_min=b, minutes=m, utilization_pct=round(b * 100.0 / m, 3))
+               for label, (b, m) in totals.items()]
+    return dict(equipment=equipment, granularity=granularity, rows=out, summary=summary,
+                days_without_bitmap=[d for d in no_bitmap if d < (start + n * DAY).date().isoformat()])
+
+def compute_daily_metrics(db: Session, day: datetime, equipment: str):
+    return compute_metrics_range(db, equipment, day, day + DAY)[0]
@@ -0,0 +1,133 @@
+from sqlalchemy import MetaData, Table, func, inspect, insert, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from .db import Base
+from .models import RawLog, Run
+from . import dims
+
+COPY_ROWS = 5000
+
+def add_column_ddl(dialect, table, col) -> str:
+    # names quoted by the dialect: columns such as ingestion_state.lines are reserved words in MySQL
+    q = dialect.identifier_preparer
+    return f"ALTER TABLE {q.format_table(table)} ADD COLUMN {q.format_column(col)} {col.type.compile(dialect=dialect)} NULL"
+
+def add_missing_columns(engine: Engine):
+    # create_all() never alters existing tables; add new nullable columns in place
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            have = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name not in have:
+                    conn.execute(text(add_column_ddl(engine.dialect, table, col)))
+
+def add_missing_indexes(engine: Engine):
+    # same for indexes declared after a table was created
+    insp = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        have = {ix["name"] for ix in insp.get_indexes(table.name)}
+        for ix in table.indexes:
+            if ix.name not in have:
+                ix.create(bind=engine)
+
+# Views with the pre-compaction column shape of raw_logs / runs (exports, archive, dashboard SQL)
+RUNS_VIEW = """
+SELECT r.id, r.equipment, r.st_time, r.sp_time, r.duration_s,
+       p.project_customer, p.project_code, m.user, m.prgver, m.codever,
+       l.sample_no, l.voltage, l.test_item, l.temp, l.category, l.accessory, l.site, l.eng_flag, l.eng_tag,
+       r.source_count, r.dedup_status, r.conflict_reason
+FROM run_rows r
+LEFT JOIN dim_project p ON p.id = r.project_id
+LEFT JOIN dim_meta m ON m.id = r.meta_id
+LEFT JOIN dim_logname l ON l.id = r.logname_id
+"""
+RAW_LOGS_VIEW = """
+SELECT r.id, r.equipment, sf.value AS source_file, r.line_no, r.st_time, r.sp_time, r.total_s,
+       pr.value AS project_raw, p.project_customer, p.project_code, m.user, m.prgver, m.codever,
+       lr.value AS logname_raw, l.sample_no, l.voltage, l.test_item, l.temp, l.category, l.accessory,
+       l.site, l.eng_flag, l.eng_tag,
+       CASE WHEN m.user IS NULL OR m.user = '' THEN 1 ELSE 0 END AS missing_user,
+       CASE WHEN m.prgver IS NULL OR m.prgver = '' THEN 1 ELSE 0 END AS missing_prgver,
+       CASE WHEN m.codever IS NULL OR m.codever = '' THEN 1 ELSE 0 END AS missing_codever,
+       LOWER(HEX(r.hash_sig)) AS hash_sig, r.inserted_at
+FROM raw_log_rows r
+LEFT JOIN dim_text sf ON sf.id = r.source_file_id
+LEFT JOIN dim_text pr ON pr.id = r.project_raw_id
+LEFT JOIN dim_text lr ON lr.id = r.logname_raw_id
+LEFT JOIN dim_project p ON p.id = r.project_id
+LEFT JOIN dim_meta m ON m.id = r.meta_id
+LEFT JOIN dim_logname l ON l.id = r.logname_id
+"""
+VIEWS = {"runs": RUNS_VIEW, "raw_logs": RAW_LOGS_VIEW}
+
+def create_views(conn):
+    if conn.dialect.name == "mysql":
+        for name, sql in VIEWS.items():
+            conn.execute(text(f"CREATE OR REPLACE VIEW {name} AS {sql}"))
+        return
+    for name, sql in VIEWS.items():
+        conn.execute(text(f"DROP VIEW IF EXISTS {name}"))
+        conn.execute(text(f"CREATE VIEW {name} AS {sql}"))
+
+def _legacy(insp, name: str) -> bool:
+    # the pre-compaction raw_logs / runs were tables with the strings inline
+    return name in insp.get_table_names() and "project_customer" in {c["name"] for c in insp.get_columns(name)}
+
+def _copy_legacy(engine: Engine, old: str, model, fields, convert=None):
+    # old -> compact table in id order, ids kept; each chunk commits on its own, so an interrupted
+    # copy resumes after the highest id already copied
+    src = Table(old, MetaData(), autoload_with=engine)
+    cols = [c.name for c in model.__table__.columns]
+    stmt = insert(model.__table__).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+    with Session(engine) as db:
+        last = db.execute(select(func.max(model.id))).scalar() or 0
+        while True:
+            rows = [dict(r) for r in db.execute(
+                select(src).where(src.c.id > last).order_by(src.c.id).limit(COPY_ROWS)).mappings()]
+            if not rows:
+                break
+            for r in rows:
+                if convert:
+                    convert(r)
+            dims.attach(db, rows, fields)
+            db.execute(stmt, [{c: r.get(c) for c in cols} for r in rows])
+            db.commit()
+            last = rows[-1]["id"]
+
+def _hash_bytes(r):
+    r["hash_sig"] = bytes.fromhex(r["hash_sig"])
+
+def copy_legacy_tables(engine: Engine) -> list:
+    # one-off: copy the raw_logs / runs tables into raw_log_rows / run_rows; returns the copied tables
+    insp = inspect(engine)
+    moved = []
+    if _legacy(insp, "raw_logs"):
+        _copy_legacy(engine, "raw_logs", RawLog, None, _hash_bytes)
+        moved.append("raw_logs")
+    if _legacy(insp, "runs"):
+        _copy_legacy(engine, "runs", Run, ("project_id", "meta_id", "logname_id"))
+        moved.append("runs")
+    return moved
+
+def rename_legacy(conn, tables):
+    # the old tables stay as raw_logs_legacy / runs_legacy; drop them by hand once the views check out
+    if not tables:
+        return
+    if conn.dialect.name == "mysql":
+        conn.execute(text("RENAME TABLE " + ", ".join(f"{t} TO {t}_legacy" for t in tables)))
+    else:
+        for t in tables:
+            conn.execute(text(f"ALTER TABLE {t} RENAME TO {t}_legacy"))
+
+def upgrade(engine: Engine):
+    add_missing_columns(engine)
+    add_missing_indexes(engine)
+    moved = copy_legacy_tables(engine)
+    with engine.begin() as conn:  # one connection: SQLite caches the schema per connection
+        rename_legacy(conn, moved)
+        create_views(conn)
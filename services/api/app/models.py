@@ -1,26 +1,42 @@
-from sqlalchemy import Column, Integer, String, BigInteger, DateTime, Boolean, UniqueConstraint, Index, Float
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime, Boolean, UniqueConstraint, Index, Float, VARBINARY, BINARY
 from sqlalchemy.dialects.mysql import TINYINT
-from .db import Base
+from .db import Base, ViewBase
 
-class RawLog(Base):
-    __tablename__ = "raw_logs"
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
-    equipment = Column(String(32), nullable=False)
-    source_file = Column(String(512), nullable=False)
-    line_no = Column(Integer, nullable=False)
-    st_time = Column(DateTime, nullable=True)
-    sp_time = Column(DateTime, nullable=True)
-    total_s = Column(Integer, nullable=True)
+# raw_logs / runs are stored compactly: the hash as BINARY(20) and repeated strings as integer keys
+# into small dim_* tables. Views named raw_logs / runs (RawLogView, RunView; created in
+# migrations) join them back into the original column shape for readers.
+
+class DimText(Base):
+    __tablename__ = "dim_text"
+    # long raw strings: source_file, project_raw, logname_raw
+    VALUE_COLS = ("value",)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    key_hash = Column(BINARY(20), nullable=False, unique=True)  # dims.key_hash of the value columns
+    value = Column(String(512), nullable=True)
 
-    project_raw = Column(String(255), nullable=True)
+class DimProject(Base):
+    __tablename__ = "dim_project"
+    VALUE_COLS = ("project_customer", "project_code")
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    key_hash = Column(BINARY(20), nullable=False, unique=True)
     project_customer = Column(String(128), nullable=True)
     project_code = Column(String(128), nullable=True)
 
+class DimMeta(Base):
+    __tablename__ = "dim_meta"
+    VALUE_COLS = ("user", "prgver", "codever")
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    key_hash = Column(BINARY(20), nullable=False, unique=True)
     user = Column(String(64), nullable=True)
     prgver = Column(String(64), nullable=True)
     codever = Column(String(64), nullable=True)
 
-    logname_raw = Column(String(512), nullable=True)
+class DimLogname(Base):
+    __tablename__ = "dim_logname"
+    # parsed LogName tokens
+    VALUE_COLS = ("sample_no", "voltage", "test_item", "temp", "category", "accessory", "site", "eng_flag", "eng_tag")
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    key_hash = Column(BINARY(20), nullable=False, unique=True)
     sample_no = Column(String(64), nullable=True)
     voltage = Column(String(64), nullable=True)
     test_item = Column(String(64), nullable=True)
@@ -28,49 +44,104 @@ class RawLog(Base):
     category = Column(String(64), nullable=True)
     accessory = Column(String(64), nullable=True)
     site = Column(String(16), nullable=True)
-
     eng_flag = Column(TINYINT, default=0)
     eng_tag = Column(String(64), nullable=True)
 
-    missing_user = Column(TINYINT, default=0)
-    missing_prgver = Column(TINYINT, default=0)
-    missing_codever = Column(TINYINT, default=0)
-
-    hash_sig = Column(String(64), nullable=False)  # sha1
+class RawLog(Base):
+    __tablename__ = "raw_log_rows"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    equipment = Column(String(32), nullable=False)
+    source_file_id = Column(Integer, nullable=True)  # dim_text
+    line_no = Column(Integer, nullable=False)
+    st_time = Column(DateTime, nullable=True)
+    sp_time = Column(DateTime, nullable=True)
+    total_s = Column(Integer, nullable=True)
+    project_raw_id = Column(Integer, nullable=True)  # dim_text
+    project_id = Column(Integer, nullable=True)
+    meta_id = Column(Integer, nullable=True)
+    logname_raw_id = Column(Integer, nullable=True)  # dim_text
+    logname_id = Column(Integer, nullable=True)
+    hash_sig = Column(BINARY(20), nullable=False)  # sha1 digest
     inserted_at = Column(DateTime, nullable=False)
     __table_args__ = (
-        UniqueConstraint("equipment","hash_sig", name="uq_equipment_hash"),
-        Index("idx_time_equipment", "equipment", "st_time", "sp_time"),
+        UniqueConstraint("equipment", "hash_sig", name="uq_raw_rows_hash"),
+        Index("idx_raw_rows_time", "equipment", "st_time", "sp_time"),
     )
 
 class Run(Base):
-    __tablename__ = "runs"
+    __tablename__ = "run_rows"
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     equipment = Column(String(32), nullable=False)
     st_time = Column(DateTime, nullable=False)
     sp_time = Column(DateTime, nullable=False)
     duration_s = Column(Integer, nullable=False)
-    project_customer = Column(String(128), nullable=True)
-    project_code = Column(String(128), nullable=True)
-    user = Column(String(64), nullable=True)
-    prgver = Column(String(64), nullable=True)
-    codever = Column(String(64), nullable=True)
-    sample_no = Column(String(64), nullable=True)
-    voltage = Column(String(64), nullable=True)
-    test_item = Column(String(64), nullable=True)
-    temp = Column(String(64), nullable=True)
-    category = Column(String(64), nullable=True)
-    accessory = Column(String(64), nullable=True)
-    site = Column(String(16), nullable=True)
-    eng_flag = Column(TINYINT, default=0)
-    eng_tag = Column(String(64), nullable=True)
+    project_id = Column(Integer, nullable=True)
+    meta_id = Column(Integer, nullable=True)
+    logname_id = Column(Integer, nullable=True)
     source_count = Column(Integer, default=1)
     dedup_status = Column(String(32), default="kept")  # kept | replaced | dropped
     conflict_reason = Column(String(255), nullable=True)
     __table_args__ = (
-        Index("idx_runs_time_equipment", "equipment", "st_time", "sp_time"),
+        Index("idx_run_rows_time", "equipment", "st_time", "sp_time"),
+        Index("idx_run_rows_page", "equipment", "st_time", "id"),  # GET /runs keyset order
     )
 
+class RawLogView(ViewBase):
+    __tablename__ = "raw_logs"
+    id = Column(BigInteger, primary_key=True)
+    equipment = Column(String(32))
+    source_file = Column(String(512))
+    line_no = Column(Integer)
+    st_time = Column(DateTime)
+    sp_time = Column(DateTime)
+    total_s = Column(Integer)
+    project_raw = Column(String(255))
+    project_customer = Column(String(128))
+    project_code = Column(String(128))
+    user = Column(String(64))
+    prgver = Column(String(64))
+    codever = Column(String(64))
+    logname_raw = Column(String(512))
+    sample_no = Column(String(64))
+    voltage = Column(String(64))
+    test_item = Column(String(64))
+    temp = Column(String(64))
+    category = Column(String(64))
+    accessory = Column(String(64))
+    site = Column(String(16))
+    eng_flag = Column(TINYINT)
+    eng_tag = Column(String(64))
+    missing_user = Column(TINYINT)
+    missing_prgver = Column(TINYINT)
+    missing_codever = Column(TINYINT)
+    hash_sig = Column(String(40))  # hex, as before
+    inserted_at = Column(DateTime)
+
+class RunView(ViewBase):
+    __tablename__ = "runs"
+    id = Column(BigInteger, primary_key=True)
+    equipment = Column(String(32))
+    st_time = Column(DateTime)
+    sp_time = Column(DateTime)
+    duration_s = Column(Integer)
+    project_customer = Column(String(128))
+    project_code = Column(String(128))
+    user = Column(String(64))
+    prgver = Column(String(64))
+    codever = Column(String(64))
+    sample_no = Column(String(64))
+    voltage = Column(String(64))
+    test_item = Column(String(64))
+    temp = Column(String(64))
+    category = Column(String(64))
+    accessory = Column(String(64))
+    site = Column(String(16))
+    eng_flag = Column(TINYINT)
+    eng_tag = Column(String(64))
+    source_count = Column(Integer)
+    dedup_status = Column(String(32))
+    conflict_reason = Column(String(255))
+
 class IngestionState(Base):
     __tablename__ = "ingestion_state"
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -78,6 +149,21 @@ class IngestionState(Base):
     source_file = Column(String(512), nullable=False)
     last_ingested_at = Column(DateTime, nullable=False)
     note = Column(String(255), nullable=True)
+    # file identity at the last commit; a mismatch means truncated/rotated -> full rescan
+    file_inode = Column(BigInteger, nullable=True)
+    file_size = Column(BigInteger, nullable=True)
+    file_mtime_ns = Column(BigInteger, nullable=True)
+    head_sha1 = Column(String(40), nullable=True)  # sha1 of the first min(4096, last_offset) bytes
+    # resume point: byte offset / line number right after the last complete line
+    last_offset = Column(BigInteger, nullable=True, default=0)
+    last_line_no = Column(Integer, nullable=True, default=0)
+    # history manifest: sha1 of the whole file as ingested (taken before reading) and what it gave;
+    # same size + mtime as recorded -> the file is skipped without opening it
+    content_sha1 = Column(String(40), nullable=True)
+    lines = Column(Integer, nullable=True)
+    raw_new = Column(Integer, nullable=True)
+    raw_dup = Column(Integer, nullable=True)
+    ingest_s = Column(Float, nullable=True)
     __table_args__ = (
         UniqueConstraint("equipment","source_file", name="uq_ingest_file"),
     )
@@ -90,7 +176,42 @@ class DailyMetrics(Base):
     busy_time_s = Column(Integer, nullable=False)
     utilization_24h_pct = Column(Float, nullable=False)
     records_count = Column(Integer, nullable=False)
+    # 1440 bits, one per minute (MSB first): set when >= 30 s of that minute is busy
+    busy_bitmap = Column(VARBINARY(180), nullable=True)
     __table_args__ = (
         UniqueConstraint("equipment","day", name="uq_daily_equipment_day"),
         Index("idx_metrics_day_equipment", "equipment", "day"),
     )
+
+class ProjectDailyRollup(Base):
+    __tablename__ = "rollup_project_daily"
+    # per (equipment, day, project, eng_flag): duration/count of runs starting that day, merged busy
+    # seconds clipped to the day. '' instead of NULL so the unique key holds for missing projects.
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    equipment = Column(String(32), nullable=False)
+    day = Column(DateTime, nullable=False)
+    project_customer = Column(String(128), nullable=False, default="")
+    project_code = Column(String(128), nullable=False, default="")
+    eng_flag = Column(TINYINT, nullable=False, default=0)
+    duration_s = Column(BigInteger, nullable=False)
+    runs_count = Column(Integer, nullable=False)
+    busy_s = Column(Integer, nullable=False)
+    __table_args__ = (
+        UniqueConstraint("equipment", "day", "project_customer", "project_code", "eng_flag", name="uq_rollup_project_day"),
+    )
+
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+    # bumped in the same transaction as every write to an equipment's runs; keys export/report caches
+    equipment = Column(String(32), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False)
+
+class Equipment(Base):
+    __tablename__ = "equipment"
+    # registry of testers; synced from EQUIPMENT_FILE at startup, read by ingest, watcher and dashboard
+    name = Column(String(32), primary_key=True)
+    log_root = Column(String(512), nullable=False)
+    hist_dir_name = Column(String(128), nullable=True)  # NULL -> settings.HIST_DIR_NAME
+    enabled = Column(TINYINT, nullable=False, default=1)
+    updated_at = Column(DateTime, nullable=False)
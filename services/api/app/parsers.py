@@ -10,6 +10,15 @@ def parse_keyvals(line: str) -> Dict[str,str]:
             kv[k.strip()] = v.strip()
     return kv
 
+def parse_total_time(total_raw: Optional[str]) -> Optional[int]:
+    # TotalTime=1234s -> 1234; anything unparsable -> None
+    if total_raw is None:
+        return None
+    try:
+        return int(float(total_raw.rstrip("s")))
+    except:
+        return None
+
 def split_project(project_raw: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
     if not project_raw or '_' not in project_raw:
         return project_raw, None
@@ -0,0 +1,92 @@
+import bz2
+import gzip
+import os
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+# Log file readers. Archived months may be compressed (.gz / .bz2 / .zst, streamed, never unpacked
+# to disk). Every reader hands over 1 MiB blocks that are cut into lines on bytes, so offsets are
+# exact byte positions of the (decompressed) text. Plain files are not memory-mapped: it was no
+# faster than block reads here, and a log truncated on the share while mapped kills the process.
+LOG_SUFFIX = "_total_run_time.txt"
+COMPRESSED = {".gz": "gzip", ".bz2": "bz2", ".zst": "zstd"}
+BLOCK_BYTES = 1 << 20
+
+def is_log_file(name: str) -> bool:
+    base, ext = os.path.splitext(name)
+    return name.endswith(LOG_SUFFIX) or (ext in COMPRESSED and base.endswith(LOG_SUFFIX))
+
+def month_key(name: str) -> str:
+    # "202501_total_run_time.txt.gz" -> "202501_total_run_time.txt"
+    base, ext = os.path.splitext(name)
+    return base if ext in COMPRESSED else name
+
+def reader_name(path: str) -> str:
+    return COMPRESSED.get(os.path.splitext(path)[1], "plain")
+
+def _open(path: str, kind: str):
+    if kind == "gzip":
+        return gzip.open(path, "rb")
+    if kind == "bz2":
+        return bz2.open(path, "rb")
+    if kind == "zstd":
+        import zstandard  # only archives compressed with zstd need it
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+    return open(path, "rb")
+
+def _blocks(path: str, kind: str, offset: int) -> Iterator[bytes]:
+    with _open(path, kind) as f:
+        if offset:
+            if kind == "plain":
+                f.seek(offset)
+            else:  # compressed streams only seek forward by decompressing
+                while offset:
+                    skipped = len(f.read(min(offset, BLOCK_BYTES)))
+                    if not skipped:
+                        return
+                    offset -= skipped
+        while True:
+            block = f.read(BLOCK_BYTES)
+            if not block:
+                return
+            yield block
+
+def _split(data: bytes, pos: int, line_no: int) -> Tuple[list, int, int]:
+    # complete lines of `data` (ends with "\n") -> ([(line_no, text, end_offset, True)], pos, line_no)
+    raw = data.split(b"\n")
+    raw.pop()
+    out = []
+    for r in raw:
+        pos += len(r) + 1
+        line_no += 1
+        text = r.decode("utf-8", errors="ignore").rstrip("\r\n")
+        if text.strip():
+            out.append((line_no, text, pos, True))
+    return out, pos, line_no
+
+def iter_lines(path: str, offset: int = 0, line_no: int = 0, info: Optional[Dict] = None):
+    # yields (line_no, text, end_offset, complete) for non-empty lines after `offset`; a last line
+    # without newline comes out with complete=False. info gets reader / bytes / seconds (reading,
+    # decompressing and splitting only, not the caller's time between lines)
+    kind = reader_name(path)
+    info = {} if info is None else info
+    info.update(reader=kind, bytes=0, seconds=0.0)
+    clock = time.perf_counter
+    pos, tail = offset, b""
+    t = clock()
+    for block in _blocks(path, kind, offset):
+        info["bytes"] += len(block)
+        data = tail + block
+        cut = data.rfind(b"\n") + 1
+        tail = data[cut:]
+        out = []
+        if cut:
+            out, pos, line_no = _split(data[:cut], pos, line_no)
+        info["seconds"] += clock() - t
+        yield from out
+        t = clock()
+    info["seconds"] += clock() - t
+    if tail:
+        text = tail.decode("utf-8", errors="ignore")
+        if text.strip():
+            yield line_no + 1, text.rstrip("\r\n"), pos + len(tail), False
@@ -0,0 +1,101 @@
+import hashlib
+import time
+from typing import Dict, Iterable, Iterator
+from sqlalchemy import MetaData, delete, insert, select
+from sqlalchemy.orm import Session
+from .db import engine
+from .exports import iter_rows
+from .ingest import RunIndex, RUN_INSERT_COLS
+from .metrics import compute_metrics_range, compute_rollups_range, runs_span
+from .models import RawLog, Run, DimProject, DimLogname
+from .versions import bump_version
+
+# Regenerate runs from raw_logs without touching the source files: one pass over an equipment's raw
+# rows in start-time order, keeping the open run per dedup key, written to a shadow table and then
+# swapped in within one transaction. The result depends only on the raw rows, not on ingest order.
+WRITE_ROWS = 5000
+
+def _shadow(equipment: str):
+    # run_rows columns without its indexes (the rows are copied into run_rows, never queried here)
+    t = Run.__table__.to_metadata(MetaData(), name="run_rows_rebuild_" + hashlib.sha1(equipment.encode()).hexdigest()[:8])
+    t.indexes.clear()
+    return t
+
+def sweep(equipment: str, rows: Iterable[tuple], keys: Dict, stats: Dict) -> Iterator[Dict]:
+    # rows: (st_time, sp_time, total_s, project_id, meta_id, logname_id) ordered by st_time;
+    # keys: (project_id, logname_id) -> dedup key. Same rules as ingest's _merge_run: an overlapping
+    # line with a longer TotalTime widens the run, otherwise it is a duplicate
+    open_runs: Dict[tuple, Dict] = {}
+    for st, sp, total_s, project_id, meta_id, logname_id in rows:
+        stats["raw"] += 1
+        if not (st and sp and total_s is not None):
+            continue
+        k = keys[(project_id, logname_id)]
+        run = open_runs.get(k)
+        if run is not None and run["st_time"] <= sp and run["sp_time"] >= st:
+            if total_s > run["duration_s"]:
+                run["st_time"], run["sp_time"] = min(run["st_time"], st), max(run["sp_time"], sp)
+                run["duration_s"] = int((run["sp_time"] - run["st_time"]).total_seconds())
+                run["source_count"] += 1
+                run["dedup_status"] = "replaced"
+            stats["runs_dups_or_replaced"] += 1
+            continue
+        if run is not None:
+            yield run  # later lines start after it ends: closed
+        dur = int(abs((sp - st).total_seconds()))
+        consistent = abs(dur - int(total_s)) <= 1
+        open_runs[k] = dict(
+            equipment=equipment, st_time=st, sp_time=sp, duration_s=dur if consistent else int(total_s),
+            project_id=project_id, meta_id=meta_id, logname_id=logname_id, source_count=1, dedup_status="kept",
+            conflict_reason=None if consistent else "time_mismatch")
+        stats["runs"] += 1
+    yield from open_runs.values()
+
+def _dedup_keys(db: Session, equipment: str) -> Dict:
+    proj = {i: (c, p) for i, c, p in db.execute(select(DimProject.id, DimProject.project_customer, DimProject.project_code))}
+    ln = {i: (s, t) for i, s, t in db.execute(select(DimLogname.id, DimLogname.sample_no, DimLogname.test_item))}
+    pairs = db.execute(select(RawLog.project_id, RawLog.logname_id).where(RawLog.equipment == equipment).distinct())
+    return {(p, l): RunIndex.key(*proj.get(p, (None, None)), *ln.get(l, (None, None))) for p, l in pairs}
+
+def rebuild_equipment(equipment: str, bind=None) -> Dict:
+    bind = bind or engine
+    t0 = time.perf_counter()
+    stats = {"raw": 0, "runs": 0, "runs_dups_or_replaced": 0}
+    shadow = _shadow(equipment)
+    shadow.drop(bind, checkfirst=True)
+    shadow.create(bind)
+    try:
+        with Session(bind) as db:
+            keys = _dedup_keys(db, equipment)
+        # lines with the same start/stop (ENG copies) go in log line order, then by hash, so a run always
+        # takes its attributes from the same line
+        q = (select(RawLog.st_time, RawLog.sp_time, RawLog.total_s, RawLog.project_id, RawLog.meta_id, RawLog.logname_id)
+             .where(RawLog.equipment == equipment)
+             .order_by(RawLog.st_time, RawLog.sp_time, RawLog.line_no, RawLog.hash_sig))
+        with bind.begin() as conn:  # committed after the read cursor is done (SQLite: one writer)
+            buf = []
+            for run in sweep(equipment, iter_rows(q, bind=bind), keys, stats):
+                buf.append(run)
+                if len(buf) >= WRITE_ROWS:
+                    conn.execute(insert(shadow), buf)
+                    buf = []
+            if buf:
+                conn.execute(insert(shadow), buf)
+        stats["sweep_s"] = round(time.perf_counter() - t0, 3)
+        t1 = time.perf_counter()
+        with bind.begin() as conn:
+            # readers see the old runs until this commits
+            conn.execute(delete(Run.__table__).where(Run.equipment == equipment))
+            conn.execute(insert(Run.__table__).from_select(RUN_INSERT_COLS, select(*(shadow.c[c] for c in RUN_INSERT_COLS))))
+            bump_version(conn, equipment)
+        stats["swap_s"] = round(time.perf_counter() - t1, 3)
+    finally:
+        shadow.drop(bind, checkfirst=True)
+    t2 = time.perf_counter()
+    with Session(bind) as db:
+        span = runs_span(db, equipment)
+        if span:
+            stats["metrics_days"] = len(compute_metrics_range(db, equipment, *span, commit=False))
+            compute_rollups_range(db, equipment, *span)
+    stats["metrics_s"] = round(time.perf_counter() - t2, 3)
+    return stats
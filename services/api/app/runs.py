@@ -0,0 +1,89 @@
+import base64
+import gzip
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import orjson
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+from .models import Run, RunView, DimProject, DimMeta, DimLogname
+
+# GET /runs: run rows as JSON pages, keyset-paginated on (equipment, st_time, id)
+# (idx_run_rows_page), never OFFSET, so page N costs the same as page 1.
+PAGE_MAX = 10000
+GZIP_MIN_BYTES = 1024
+
+# dim table per string column and the run_rows key pointing at it
+_DIMS = ((DimProject, Run.project_id), (DimMeta, Run.meta_id), (DimLogname, Run.logname_id))
+FIELDS = [c.name for c in RunView.__table__.columns]  # what the runs view shows, in its order
+
+def _column(name: str):
+    if name in Run.__table__.c:
+        return Run.__table__.c[name], None
+    for dim, fk in _DIMS:
+        if name in dim.VALUE_COLS:
+            return getattr(dim, name), (dim, fk)
+    raise KeyError(name)
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    # "a,b,c" -> validated column names (all view columns when empty)
+    if not fields:
+        return FIELDS
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    bad = [n for n in names if n not in FIELDS]
+    if bad:
+        raise ValueError(f"unknown fields: {', '.join(bad)}")
+    return list(dict.fromkeys(names))
+
+def encode_cursor(equipment: str, st_time: datetime, run_id: int) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps([equipment, st_time, run_id])).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, datetime, int]:
+    try:
+        equipment, st, run_id = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(equipment), datetime.fromisoformat(st), int(run_id)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+def page_select(fields: List[str], filters: Dict, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                after: Optional[Tuple] = None, limit: int = 1000):
+    # only the requested columns plus the keyset, joining only the dims they (or the filters) need;
+    # filters: {column: value}, None = no filter
+    keys = [Run.equipment, Run.st_time, Run.id]
+    cols = [_column(f) for f in fields]
+    conds = []
+    for name, value in filters.items():
+        if value is not None:
+            col, dim = _column(name)
+            cols.append((None, dim))
+            conds.append(col == value)
+    if start:
+        conds.append(Run.st_time >= start)
+    if end:
+        conds.append(Run.sp_time < end)
+    if after is not None:
+        conds.append(tuple_(*keys) > tuple_(*after))
+    q = select(*keys, *(c for c, _ in cols if c is not None)).select_from(Run.__table__)
+    joined = set()
+    for _, dim in cols:
+        if dim and dim[0] not in joined:
+            joined.add(dim[0])
+            q = q.outerjoin(dim[0], dim[0].id == dim[1])
+    return q.where(*conds).order_by(*keys).limit(limit + 1)
+
+def fetch_page(db: Session, fields: List[str], filters: Dict, start: Optional[datetime] = None,
+               end: Optional[datetime] = None, cursor: Optional[str] = None, limit: int = 1000) -> Dict:
+    # {"items": [{field: value}], "next": cursor of the following page or None}
+    after = decode_cursor(cursor) if cursor else None
+    rows = db.execute(page_select(fields, filters, start, end, after, limit)).all()
+    items = [dict(zip(fields, r[3:])) for r in rows[:limit]]
+    nxt = encode_cursor(*rows[limit - 1][:3]) if len(rows) > limit else None
+    return {"items": items, "next": nxt}
+
+def render(page: Dict, gzip_ok: bool) -> Tuple[bytes, Dict[str, str]]:
+    # orjson writes datetimes as ISO 8601 itself; small bodies are not worth compressing
+    body = orjson.dumps(page)
+    headers = {"Vary": "Accept-Encoding"}
+    if gzip_ok and len(body) >= GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
@@ -1,9 +1,28 @@
 from pydantic import BaseModel
 from typing import Optional, List
 
+class FileIngestStats(BaseModel):
+    equipment: str
+    file: str
+    lines: int
+    raw_new: int
+    raw_dup: int
+    runs_new: int
+    runs_dups_or_replaced: int
+    parse_s: float
+    write_s: float
+
+class RefreshedDay(BaseModel):
+    equipment: str
+    day: str
+
 class IngestStats(BaseModel):
     lines: int
     raw_new: int
     raw_dup: int
     runs_new: int
     runs_dups_or_replaced: int
+    bytes_skipped: int = 0  # already-ingested bytes not re-read (incremental tail)
+    files_skipped: int = 0  # history files unchanged since they were ingested (manifest)
+    files: Optional[List[FileIngestStats]] = None  # per-file timing (historical backfill)
+    refreshed_days: List[RefreshedDay] = []  # metrics_daily rows recomputed because their runs changed
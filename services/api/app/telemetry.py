@@ -0,0 +1,140 @@
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy import event
+
+# Prometheus metrics, exposed at GET /metrics/prom. Route latency and SQL statements per request
+# come from an ASGI middleware plus SQLAlchemy cursor events; ingest stages, line rates and job
+# durations are reported by ingest_file / backfill / jobs.
+STAGES = ("read", "parse", "dedup", "insert", "merge", "commit")
+_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+
+INGEST_STAGE = Histogram("s100_ingest_stage_seconds", "Per-file time spent in each ingest stage",
+                         ["equipment", "stage"], buckets=_SECONDS)
+INGEST_FILE = Histogram("s100_ingest_file_seconds", "Per-file ingest wall time", ["equipment"], buckets=_SECONDS)
+INGEST_LINES = Counter("s100_ingest_lines_total", "Log lines read", ["equipment"])
+INGEST_RAW_NEW = Counter("s100_ingest_raw_new_total", "New raw_logs rows", ["equipment"])
+INGEST_RAW_DUP = Counter("s100_ingest_raw_duplicates_total", "Lines dropped as duplicate hashes", ["equipment"])
+INGEST_RUNS_NEW = Counter("s100_ingest_runs_new_total", "New runs", ["equipment"])
+INGEST_RUNS_MERGED = Counter("s100_ingest_runs_merged_total", "Lines merged into / replacing an existing run", ["equipment"])
+INGEST_RATE = Gauge("s100_ingest_lines_per_second", "Lines/s of the last ingested file", ["equipment"])
+READ_BYTES = Counter("s100_ingest_read_bytes_total", "Log bytes read (decompressed) per reader", ["reader"])
+READ_SECONDS = Counter("s100_ingest_read_seconds_total", "Time spent reading/decompressing/splitting lines per reader",
+                       ["reader"])
+READ_RATE = Gauge("s100_ingest_read_bytes_per_second", "Bytes/s of the last file read by each reader", ["reader"])
+INGEST_LAST = Gauge("s100_ingest_last_file_timestamp_seconds", "When the last file ingest finished", ["equipment"])
+
+JOB_SECONDS = Histogram("s100_job_seconds", "Background ingest job duration (scheduler, watcher, API)",
+                        ["kind", "status"], buckets=_SECONDS)
+JOB_LAST_SUCCESS = Gauge("s100_job_last_success_timestamp_seconds", "Last successful job per kind and equipment",
+                         ["kind", "equipment"])
+WATCH_LAG = Gauge("s100_watch_lag_seconds", "Age of the oldest change not yet ingested by the watcher", ["equipment"])
+
+RESPONSE_CACHE = Counter("s100_response_cache_total", "Version-keyed responses: hit, miss or not_modified (304)",
+                         ["route", "result"])
+
+HTTP_SECONDS = Histogram("s100_http_request_seconds", "Request latency until the body is sent",
+                         ["method", "route", "status"], buckets=_SECONDS)
+HTTP_SQL = Histogram("s100_http_sql_statements", "SQL statements per request", ["route"],
+                     buckets=(0, 1, 2, 5, 10, 20, 50, 100, 500, 1000))
+SQL_SECONDS = Histogram("s100_sql_statement_seconds", "SQL statement latency", ["route"],
+                        buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5, 30))
+
+# per-request {"scope", "sql"} while serving HTTP; outside requests statements are labelled
+# with the job kind running on the thread ("job:nightly", ...) or "background"
+_request: ContextVar[Optional[dict]] = ContextVar("s100_request", default=None)
+_job: ContextVar[str] = ContextVar("s100_job", default="background")
+
+def _route_of(scope) -> str:
+    # the route template ("/metrics/daily"); the router sets it on the scope once matched
+    return getattr(scope.get("route"), "path", "unmatched")
+
+def _label() -> str:
+    req = _request.get()
+    return _job.get() if req is None else _route_of(req["scope"])
+
+def stage_timer() -> Dict[str, float]:
+    return dict.fromkeys(STAGES, 0.0)
+
+def observe_stages(equipment: str, timings: Dict[str, float]):
+    for stage, sec in timings.items():
+        INGEST_STAGE.labels(equipment, stage).observe(sec)
+
+def observe_file(equipment: str, stats: Dict, seconds: float, timings: Dict[str, float]):
+    observe_stages(equipment, timings)
+    INGEST_FILE.labels(equipment).observe(seconds)
+    INGEST_LINES.labels(equipment).inc(stats["lines"])
+    INGEST_RAW_NEW.labels(equipment).inc(stats["raw_new"])
+    INGEST_RAW_DUP.labels(equipment).inc(stats["raw_dup"])
+    INGEST_RUNS_NEW.labels(equipment).inc(stats["runs_new"])
+    INGEST_RUNS_MERGED.labels(equipment).inc(stats["runs_dups_or_replaced"])
+    if stats["lines"] and seconds > 0:
+        INGEST_RATE.labels(equipment).set(stats["lines"] / seconds)
+    INGEST_LAST.labels(equipment).set_to_current_time()
+
+def observe_read(info: Dict):
+    # info: from readers.iter_lines (reader, bytes, seconds)
+    READ_BYTES.labels(info["reader"]).inc(info["bytes"])
+    READ_SECONDS.labels(info["reader"]).inc(info["seconds"])
+    if info["bytes"] and info["seconds"] > 0:
+        READ_RATE.labels(info["reader"]).set(info["bytes"] / info["seconds"])
+
+def observe_job(kind: str, equipment, status: str, seconds: float):
+    JOB_SECONDS.labels(kind, status).observe(seconds)
+    if status == "done":
+        for e in equipment:
+            JOB_LAST_SUCCESS.labels(kind, e).set_to_current_time()
+
+def observe_cache(scope, result: str):
+    RESPONSE_CACHE.labels(_route_of(scope), result).inc()
+
+def set_job(kind: str):
+    _job.set(f"job:{kind}")
+
+def instrument_engine(engine):
+    # the start time rides on the statement's execution context, so a statement that raises
+    # (no after_cursor_execute) leaves nothing behind on the pooled connection
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._s100_t0 = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        t0 = getattr(context, "_s100_t0", None)
+        if t0 is None:
+            return
+        SQL_SECONDS.labels(_label()).observe(time.perf_counter() - t0)
+        req = _request.get()
+        if req is not None:
+            req["sql"] += 1
+
+class PrometheusMiddleware:
+    # plain ASGI so streamed bodies (CSV export) are timed until the last chunk
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        status = [500]
+        req = {"scope": scope, "sql": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        token = _request.set(req)  # copied into the threadpool that runs sync endpoints
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request.reset(token)
+            route = _route_of(scope)
+            HTTP_SECONDS.labels(scope["method"], route, str(status[0])).observe(time.perf_counter() - t0)
+            HTTP_SQL.labels(route).observe(req["sql"])
+
+def exposition():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,13 +1,31 @@
+import re
 import hashlib
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from dateutil import parser as dtparser, tz
 
 TPE = tz.gettz("Asia/Taipei")
+TPE_FIXED = timezone(timedelta(hours=8))  # Taiwan has not observed DST since 1979
 
+# StTime/SpTime as written by the tester: 2025/9/12-9:57 or 2025/9/12-9:57:03
+_tester_time_re = re.compile(r'^(\d{4})[/-](\d{1,2})[/-](\d{1,2})[- ](\d{1,2}):(\d{1,2})(?::(\d{1,2}))?$')
+
+@lru_cache(maxsize=65536)  # StTime/SpTime strings repeat across ENG duplicates and re-runs
 def parse_time(s: str):
     s = (s or "").strip()
     if not s:
         return None
+    m = _tester_time_re.match(s)
+    if m:
+        y, mo, d, h, mi, sec = m.groups()
+        try:
+            return datetime(int(y), int(mo), int(d), int(h), int(mi), int(sec or 0))
+        except ValueError:
+            pass  # out-of-range field; let dateutil decide
+    return _parse_time_dateutil(s)
+
+def _parse_time_dateutil(s: str):
+    # slow path for anything that is not the tester's own format
     s2 = s.replace('/', '-')  # 2025/9/12-9:57 -> 2025-9-12-9:57
     try:
         # 若像 YYYY-MM-DD-HH:MM(:SS)? 就從「最後一個 -」切成 日期 與 時間
@@ -21,9 +39,8 @@ def parse_time(s: str):
         dt = dtparser.parse(s_fmt, yearfirst=True, dayfirst=False)
         # 一律視為台北時間，最後回傳「去掉 tzinfo 的本地時間」
         if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=TPE)
-        dt = dt.astimezone(TPE).replace(tzinfo=None)
-        return dt
+            return dt
+        return dt.astimezone(TPE_FIXED).replace(tzinfo=None)
     except Exception:
         return None
 
@@ -0,0 +1,33 @@
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from sqlalchemy import insert, select, update
+from .models import DataVersion
+from .utils import TPE
+
+def bump_version(db, equipment: str):
+    # call inside the writing transaction so readers never see new rows under the old version
+    now = datetime.now(TPE).replace(tzinfo=None)
+    db.execute(insert(DataVersion).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite"),
+               {"equipment": equipment, "version": 0, "updated_at": now})
+    db.execute(update(DataVersion).where(DataVersion.equipment == equipment)
+               .values(version=DataVersion.version + 1, updated_at=now))
+
+def data_versions(db, equipment: Optional[str] = None) -> Dict[str, int]:
+    # db: Session or Connection; equipment=None -> every equipment
+    q = select(DataVersion.equipment, DataVersion.version)
+    if equipment:
+        q = q.where(DataVersion.equipment == equipment)
+    res = {e: v for e, v in db.execute(q)}
+    if equipment:
+        res.setdefault(equipment, 0)
+    return res
+
+def version_info(db, equipment: Optional[str] = None) -> Dict[str, Tuple[int, Optional[datetime]]]:
+    # like data_versions, with when each version was set (naive TPE); HTTP validators use both
+    q = select(DataVersion.equipment, DataVersion.version, DataVersion.updated_at)
+    if equipment:
+        q = q.where(DataVersion.equipment == equipment)
+    res = {e: (v, at) for e, v, at in db.execute(q)}
+    if equipment:
+        res.setdefault(equipment, (0, None))
+    return res
@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from .config import settings
+from .ingest import find_month_file
+from .utils import TPE
+from . import jobs
+
+# Near-real-time ingest: watch each equipment's log root for appends to the current month file,
+# debounce bursts, then run an incremental ingest (+ metrics refresh) for that equipment only.
+# inotify (via watchfiles) on local filesystems, mtime/size polling on SMB/NFS where inotify
+# never sees remote writes.
+NETWORK_FS = {"cifs", "smb3", "smbfs", "nfs", "nfs4", "fuse.sshfs"}
+
+def _fs_type(path: str) -> Optional[str]:
+    # fstype of the longest mount point containing path
+    best, fstype = "", None
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                mnt = parts[1].replace("\\040", " ")
+                if (path == mnt or path.startswith(mnt.rstrip("/") + "/")) and len(mnt) > len(best):
+                    best, fstype = mnt, parts[2]
+    except OSError:
+        pass
+    return fstype
+
+def _ts(t: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(t, TPE).replace(tzinfo=None).isoformat(timespec="seconds") if t else None
+
+def _current_name() -> str:
+    now = datetime.now(TPE)
+    return f"{now.year:04d}{now.month:02d}_total_run_time.txt"
+
+class Watcher:
+    def __init__(self, targets: List[Tuple[str, str]], ingest: Callable, mode: str = "auto"):
+        # ingest(equipment, progress) -> stats; runs through the job queue
+        self.targets = targets
+        self.ingest = ingest
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.state: Dict[str, Dict] = {}
+        for equip, root in targets:
+            m = mode
+            if m == "auto":
+                m = "poll" if _fs_type(os.path.realpath(root)) in NETWORK_FS else "inotify"
+            if m == "inotify" and not os.path.isdir(root):
+                m = "poll"  # inotify needs the directory to exist now; polling notices it showing up
+            self.state[equip] = dict(root=root, mode=m, last_event=None, pending_since=None, last_change=None,
+                                     running=False, inflight_since=None, last_submit=None, last_done=None, last_lag_s=None,
+                                     last_job=None, last_error=None, events=0, ingests=0, fingerprint=None)
+        self.threads: List[threading.Thread] = []
+
+    def start(self):
+        inotify = [e for e, s in self.state.items() if s["mode"] == "inotify"]
+        if inotify:
+            self.threads.append(threading.Thread(target=self._inotify_loop, args=(inotify,), daemon=True, name="watch-inotify"))
+        if any(s["mode"] == "poll" for s in self.state.values()):
+            self.threads.append(threading.Thread(target=self._poll_loop, daemon=True, name="watch-poll"))
+        self.threads.append(threading.Thread(target=self._dispatch_loop, daemon=True, name="watch-dispatch"))
+        for t in self.threads:
+            t.start()
+        for equip in self.state:
+            self.event(equip)  # catch up on whatever was appended while the API was down
+
+    def stop(self):
+        self.stop_event.set()
+        for t in self.threads:
+            t.join(timeout=5)
+
+    def event(self, equip: str):
+        now = time.time()
+        with self.lock:
+            s = self.state[equip]
+            s["events"] += 1
+            s["last_event"] = s["last_change"] = now
+            if s["pending_since"] is None:
+                s["pending_since"] = now
+
+    def _inotify_loop(self, equips: List[str]):
+        import watchfiles
+        roots = {os.path.realpath(self.state[e]["root"]): e for e in equips}
+        for changes in watchfiles.watch(*roots, recursive=False, stop_event=self.stop_event,
+                                        debounce=200, raise_interrupt=False):
+            name = _current_name()
+            for _, path in changes:
+                if os.path.basename(path) == name:
+                    equip = roots.get(os.path.dirname(os.path.realpath(path)))
+                    if equip:
+                        self.event(equip)
+
+    def _poll_loop(self):
+        # stat only; the ingest itself reads just the new tail
+        while not self.stop_event.wait(settings.WATCH_POLL_S):
+            now = datetime.now(TPE)
+            for equip, s in self.state.items():
+                if s["mode"] != "poll":
+                    continue
+                path = find_month_file(s["root"], now.year, now.month)
+                try:
+                    st = os.stat(path) if path else None
+                except OSError:
+                    st = None
+                fp = st and (path, st.st_size, st.st_mtime_ns)
+                if fp != s["fingerprint"]:
+                    s["fingerprint"] = fp
+                    if fp:
+                        self.event(equip)
+
+    def _dispatch_loop(self):
+        # the quiet time only batches appends; a line still being written when the ingest runs is
+        # safe because incremental ingest leaves an unterminated last line for the next round
+        while not self.stop_event.wait(0.5):
+            now = time.time()
+            for equip, s in self.state.items():
+                with self.lock:
+                    if s["pending_since"] is None or s["running"]:
+                        continue
+                    quiet = now - s["last_change"] >= settings.WATCH_DEBOUNCE_S
+                    overdue = now - s["pending_since"] >= settings.WATCH_MAX_DELAY_S
+                    spaced = s["last_submit"] is None or now - s["last_submit"] >= settings.WATCH_MIN_INTERVAL_S
+                    if not ((quiet or overdue) and spaced):
+                        continue
+                    since, s["pending_since"] = s["pending_since"], None
+                    s["running"], s["inflight_since"], s["last_submit"] = True, since, now
+                job = jobs.submit("watch", (equip,), self._job(equip, since))
+                with self.lock:
+                    s["last_job"] = job["id"]
+                    if job["coalesced"]:  # folded into a job already in flight; ours never runs
+                        s["running"], s["inflight_since"] = False, None
+                        s["pending_since"] = s["pending_since"] or since
+
+    def _job(self, equip: str, since: float):
+        def run(progress):
+            s = self.state[equip]
+            err = None
+            try:
+                return self.ingest(equip, progress)
+            except Exception as e:
+                err = repr(e)
+                raise
+            finally:
+                with self.lock:
+                    done = time.time()
+                    s["running"], s["inflight_since"] = False, None
+                    s["last_error"] = err
+                    if err is None:
+                        s["ingests"] += 1
+                        s["last_done"], s["last_lag_s"] = done, round(done - since, 1)
+                    elif s["pending_since"] is None:
+                        s["pending_since"] = since  # retry on the next round
+        return run
+
+    def health(self) -> Dict:
+        now = time.time()
+        out = {}
+        with self.lock:
+            for equip, s in self.state.items():
+                oldest = min(filter(None, (s["pending_since"], s["inflight_since"])), default=None)
+                out[equip] = dict(
+                    mode=s["mode"], root=s["root"], events=s["events"], ingests=s["ingests"],
+                    last_event_at=_ts(s["last_event"]), last_ingest_at=_ts(s["last_done"]),
+                    pending=s["pending_since"] is not None, running=s["running"], last_job=s["last_job"],
+                    # seconds the oldest un-ingested change has been waiting; 0 when caught up
+                    lag_s=round(now - oldest, 1) if oldest else 0.0,
+                    last_lag_s=s["last_lag_s"], last_error=s["last_error"],
+                )
+        return {"enabled": True, "alive": all(t.is_alive() for t in self.threads), "equipment": out}
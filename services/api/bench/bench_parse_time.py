@@ -0,0 +1,47 @@
+"""Micro-benchmark: utils.parse_time (fast path + cache) vs the dateutil-only parser.
+
+    cd services/api && python -m bench.bench_parse_time [n_lines]
+"""
+import sys, random, time
+from datetime import datetime, timedelta
+from app.utils import parse_time, _parse_time_dateutil
+
+def dateutil_only(s):
+    # the previous parse_time: strip, then dateutil for everything
+    s = (s or "").strip()
+    return _parse_time_dateutil(s) if s else None
+
+def month_of_times(n: int, seed: int = 0):
+    # StTime/SpTime pairs shaped like a month file; ~25% ENG duplicates repeat the same strings
+    rnd = random.Random(seed)
+    t = datetime(2025, 9, 1, 8, 0)
+    out = []
+    while len(out) < n:
+        sp = t + timedelta(seconds=rnd.randint(60, 7200))
+        fmt = lambda d: f"{d.year}/{d.month}/{d.day}-{d.hour}:{d.minute:02d}" + (f":{d.second:02d}" if rnd.random() < 0.5 else "")
+        pair = [fmt(t), fmt(sp)]
+        out += pair * (2 if rnd.random() < 0.25 else 1)
+        t = sp + timedelta(seconds=rnd.randint(0, 900))
+    return out[:n]
+
+def bench(fn, inputs, clear=None):
+    if clear:
+        clear()
+    t0 = time.perf_counter()
+    for s in inputs:
+        fn(s)
+    return time.perf_counter() - t0
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    inputs = month_of_times(n)
+    assert all(parse_time(s) == dateutil_only(s) for s in inputs[:5000])
+    slow = bench(dateutil_only, inputs)
+    nocache = bench(parse_time.__wrapped__, inputs)
+    cached = bench(parse_time, inputs, parse_time.cache_clear)
+    print(f"{n} strings ({len(set(inputs))} distinct)")
+    for name, sec in (("dateutil only", slow), ("fast path, no cache", nocache), ("fast path + LRU", cached)):
+        print(f"  {name:<22} {sec*1e3:9.1f} ms  {n/sec/1e6:6.2f} M/s  x{slow/sec:5.1f}")
+
+if __name__ == "__main__":
+    main()
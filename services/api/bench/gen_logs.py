@@ -0,0 +1,100 @@
+"""Synthetic S100 log generator: YYYYMM_total_run_time.txt files shaped like the testers' output.
+
+    cd services/api && python -m bench.gen_logs OUT_DIR [--months 12] [--lines 20000] [--equipment s100-1 s100-2]
+
+Writes OUT_DIR/<equipment>/S100_test_log/<YYYYMM>_total_run_time.txt for every month but the last,
+which goes to OUT_DIR/<equipment>/ as the "current" file. Mixes in what real files contain:
+v1 lines (no User/PrgVer/CodeVer) before --v2-from, ENG-prefixed duplicates of formal runs,
+overlapping re-runs of the same sample/test item, TotalTime that disagrees with StTime/SpTime,
+repeated lines and blank lines.
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+
+CUSTOMERS = ["S0001", "S0004", "ACME", "FOO", "BAR", "Q7"]
+VOLTAGES = ["3P5V", "4P7V", "5V", "3P41V"]
+ITEMS = ["C1", "C6", "C8", "RUN4", "TT1"]
+TEMPS = ["25C", "-40C", "85C"]
+ACCESSORIES = ["S12COB", "S12A24", "S8X"]
+
+def _fmt(d: datetime, rnd: random.Random) -> str:
+    # the tester mixes 2025/9/1-8:05 and 2025/9/1-8:05:33
+    s = f"{d.year}/{d.month}/{d.day}-{d.hour}:{d.minute:02d}"
+    return s + f":{d.second:02d}" if rnd.random() < 0.6 else s
+
+def month_lines(year: int, month: int, n: int, rnd: random.Random, v2: bool, eng: float = 0.15,
+                rerun: float = 0.08, mismatch: float = 0.1, repeat: float = 0.03):
+    t = datetime(year, month, 1, 0, rnd.randint(0, 59))
+    out = []
+    while len(out) < n:
+        dur = rnd.randint(60, 4 * 3600)
+        st, sp = t, t + timedelta(seconds=dur)
+        total = dur if rnd.random() > mismatch else dur + rnd.randint(5, 600)
+        cust = rnd.choice(CUSTOMERS)
+        project = f"{cust}_P{rnd.randint(100, 140)}" if rnd.random() > 0.05 else cust
+        logname = "_".join([f"S{rnd.randint(1, 400):04d}", rnd.choice(VOLTAGES), rnd.choice(ITEMS), rnd.choice(TEMPS),
+                            "TT", rnd.choice(ACCESSORIES), f"s{rnd.randint(1, 4)}"])
+        extra = f", User=u{rnd.randint(1, 12)}, PrgVer=1.{rnd.randint(0, 9)}, CodeVer=2.{rnd.randint(0, 3)}" if v2 else ""
+
+        def line(a, b, tt, ln):
+            return f"StTime={_fmt(a, rnd)}, SpTime={_fmt(b, rnd)}, TotalTime={tt}s, Project={project}, LogName={ln}{extra}"
+
+        out.append(line(st, sp, total, logname))
+        if rnd.random() < eng:
+            out.append(line(st, sp, total, f"ENG-{rnd.randint(1, 9)}-{logname}"))
+        if rnd.random() < rerun:
+            # same sample/test item again, shifted and usually longer -> overlap merge / replace
+            a = st + timedelta(seconds=rnd.randint(-300, 300))
+            b = sp + timedelta(seconds=rnd.randint(-120, 1800))
+            out.append(line(a, b, int((b - a).total_seconds()), logname))
+        if rnd.random() < repeat:
+            out.append(out[-1])
+        if rnd.random() < 0.01:
+            out.append("")
+        t = sp + timedelta(seconds=rnd.randint(-900, 1800))
+        if t.month != month:
+            t = datetime(year, month, 1, rnd.randint(0, 23), rnd.randint(0, 59))
+    return out[:n]
+
+def generate(out_dir: str, equipment=("s100-1", "s100-2"), months: int = 12, lines: int = 20000,
+             end: tuple = None, v2_from: int = None, seed: int = 0, hist_dir_name: str = "S100_test_log"):
+    # returns {equipment: [file paths, oldest first]}
+    end = end or (datetime.now().year, datetime.now().month)
+    ym = []
+    y, m = end
+    for _ in range(months):
+        ym.append((y, m))
+        y, m = (y, m - 1) if m > 1 else (y - 1, 12)
+    ym.reverse()
+    v2_from = months // 2 if v2_from is None else v2_from
+    files = {}
+    for e_i, equip in enumerate(equipment):
+        rnd = random.Random(seed * 1000 + e_i)
+        hist = os.path.join(out_dir, equip, hist_dir_name)
+        os.makedirs(hist, exist_ok=True)
+        files[equip] = []
+        for i, (y, m) in enumerate(ym):
+            d = os.path.join(out_dir, equip) if i == len(ym) - 1 else hist
+            path = os.path.join(d, f"{y:04d}{m:02d}_total_run_time.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n".join(month_lines(y, m, lines, rnd, v2=i >= v2_from)) + "\n")
+            files[equip].append(path)
+    return files
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("out_dir")
+    ap.add_argument("--equipment", nargs="+", default=["s100-1", "s100-2"])
+    ap.add_argument("--months", type=int, default=12)
+    ap.add_argument("--lines", type=int, default=20000, help="lines per month file")
+    ap.add_argument("--v2-from", type=int, default=None, help="first month index with User/PrgVer/CodeVer")
+    ap.add_argument("--seed", type=int, default=0)
+    a = ap.parse_args()
+    files = generate(a.out_dir, a.equipment, a.months, a.lines, v2_from=a.v2_from, seed=a.seed)
+    for equip, paths in files.items():
+        print(equip, len(paths), "files,", sum(os.path.getsize(p) for p in paths) // 1024, "KiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""Benchmark harness: parse, ingest, metrics and export on generated month files; results as JSON.
+
+    cd services/api && python -m bench.run_bench [--months 6] [--lines 20000] [--out bench.json] [--db-url URL]
+
+Without --db-url the database is a throwaway SQLite file (MySQL-only column types are compiled to
+SQLite equivalents here, the app itself is untouched), so absolute numbers are a stand-in for MySQL;
+compare runs made with the same settings on the same machine. --logs reuses an existing tree from
+bench.gen_logs instead of generating one.
+"""
+import argparse
+import bz2
+import gzip
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from sqlalchemy import BigInteger, create_engine
+from sqlalchemy.dialects.mysql import TINYINT
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.db import Base
+from app import models  # noqa: F401  (registers the tables)
+from app.migrations import upgrade
+from app import readers
+from app.ingest import iter_record_batches, ingest_file, ingest_historical, list_history_files, find_month_file
+from app.metrics import compute_metrics_range, compute_rollups_range, merge_intervals, runs_span
+from app.exports import iter_rows, iter_csv, runs_select, write_xlsx
+from app.rebuild import rebuild_equipment
+from app.parsers import parse_logname
+from app.utils import parse_time
+from bench.gen_logs import generate
+
+@compiles(TINYINT, "sqlite")
+def _tinyint_sqlite(element, compiler, **kw):
+    return "SMALLINT"
+
+@compiles(BigInteger, "sqlite")
+def _bigint_sqlite(element, compiler, **kw):
+    return "INTEGER"  # SQLite only autoincrements INTEGER PRIMARY KEY
+
+def timed(fn, *args, memory=True, **kw):
+    # wall time of one call, then (optionally) a second traced call for the Python heap peak
+    t0 = time.perf_counter()
+    out = fn(*args, **kw)
+    res = {"seconds": round(time.perf_counter() - t0, 4)}
+    if memory:
+        tracemalloc.start()
+        fn(*args, **kw)
+        res["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        tracemalloc.stop()
+    return out, res
+
+def rate(n, seconds):
+    return round(n / seconds, 1) if seconds > 0 else None
+
+def files_for(root: str, equipment: str):
+    # history oldest first, then the current month file (what run_historical + run_current ingest)
+    base = os.path.join(root, equipment)
+    files = list_history_files(base, settings.HIST_DIR_NAME)
+    names = [os.path.basename(p)[:6] for p in os.listdir(base) if p.endswith("_total_run_time.txt")]
+    for ym in sorted(names):
+        cur = find_month_file(base, int(ym[:4]), int(ym[4:]))
+        if cur:
+            files.append(cur)
+    return files
+
+def bench_micro(lines):
+    kvs = [dict(p.split("=", 1) for p in ln.split(", ")) for ln in lines if ln]
+    times = [s for kv in kvs for s in (kv["StTime"], kv["SpTime"])]
+    lognames = [kv["LogName"] for kv in kvs]
+    out = {}
+    parse_time.cache_clear()
+    t0 = time.perf_counter()
+    parsed = [parse_time(s) for s in times]
+    out["parse_time"] = {"n": len(times), "per_s": rate(len(times), time.perf_counter() - t0)}
+    t0 = time.perf_counter()
+    for s in lognames:
+        parse_logname(s)
+    out["parse_logname"] = {"n": len(lognames), "per_s": rate(len(lognames), time.perf_counter() - t0)}
+    ivs = [(a, b) for a, b in zip(parsed[::2], parsed[1::2]) if a and b and a < b]
+    t0 = time.perf_counter()
+    merged = merge_intervals(ivs)
+    out["merge_intervals"] = {"n": len(ivs), "merged": len(merged), "per_s": rate(len(ivs), time.perf_counter() - t0)}
+    return out
+
+def bench_parse(files):
+    nbytes = sum(os.path.getsize(p) for _, p in files)
+    t0, lines = time.perf_counter(), 0
+    for equip, path in files:
+        for _, n, _, _ in iter_record_batches(equip, path):
+            lines += n
+    sec = time.perf_counter() - t0
+    return {"python": {"lines": lines, "seconds": round(sec, 4), "lines_per_s": rate(lines, sec),
+                       "mb_per_s": rate(nbytes / 2**20, sec)}}
+
+def _compressors():
+    out = {"gzip": (".gz", gzip.compress), "bz2": (".bz2", bz2.compress)}
+    try:
+        import zstandard
+        out["zstd"] = (".zst", zstandard.ZstdCompressor().compress)
+    except ImportError:  # zstd archives need the zstandard package
+        pass
+    return out
+
+def bench_readers(files, tmp):
+    # every file as the archive team would store it, read back line by line (what ingest sees);
+    # mb_per_s is decompressed text per second, read_mb_per_s the reader's own share of that
+    out = {}
+    arch = os.path.join(tmp, "archived")
+    os.makedirs(arch, exist_ok=True)
+    variants = {"plain": [p for _, p in files]}
+    for kind, (ext, compress) in _compressors().items():
+        variants[kind] = []
+        for i, (_, p) in enumerate(files):
+            dst = os.path.join(arch, f"{i}_{os.path.basename(p)}{ext}")
+            with open(p, "rb") as src, open(dst, "wb") as f:
+                f.write(compress(src.read()))
+            variants[kind].append(dst)
+    for kind, paths in variants.items():
+        t0, lines, nbytes, read_s = time.perf_counter(), 0, 0, 0.0
+        for path in paths:
+            info = {}
+            lines += sum(1 for _ in readers.iter_lines(path, info=info))
+            nbytes += info["bytes"]
+            read_s += info["seconds"]
+        sec = time.perf_counter() - t0
+        out[kind] = {"lines": lines, "seconds": round(sec, 4), "mb_per_s": rate(nbytes / 2**20, sec),
+                     "read_mb_per_s": rate(nbytes / 2**20, read_s),
+                     "stored_mb": round(sum(os.path.getsize(p) for p in paths) / 2**20, 2)}
+    return out
+
+def bench_ingest(Session, files):
+    stats, per_file = {"lines": 0, "raw_new": 0, "raw_dup": 0}, []
+    t0 = time.perf_counter()
+    with Session() as db:
+        for equip, path in files:
+            t1 = time.perf_counter()
+            s = ingest_file(db, equip, path, incremental=True)
+            sec = time.perf_counter() - t1
+            per_file.append({"file": os.path.relpath(path, os.path.dirname(os.path.dirname(path))),
+                             "lines": s["lines"], "seconds": round(sec, 4), "lines_per_s": rate(s["lines"], sec)})
+            for k in stats:
+                stats[k] += s.get(k, 0)
+    sec = time.perf_counter() - t0
+    # re-running the current file is the watcher's steady state: nothing new to read
+    t1 = time.perf_counter()
+    with Session() as db:
+        ingest_file(db, *files[-1], incremental=True)
+    noop = time.perf_counter() - t1
+    # historical ingest again: the first pass re-reads everything and records the file manifests,
+    # the second finds every month unchanged
+    roots = sorted({(e, os.path.dirname(os.path.dirname(p))) for e, p in files
+                    if os.path.basename(os.path.dirname(p)) == settings.HIST_DIR_NAME})
+    hist = []
+    for _ in range(2):
+        t1 = time.perf_counter()
+        with Session() as db:
+            for equip, base in roots:
+                ingest_historical(db, equip, base, settings.HIST_DIR_NAME)
+        hist.append(round(time.perf_counter() - t1, 4))
+    return dict(stats, seconds=round(sec, 4), lines_per_s=rate(stats["lines"], sec),
+                noop_rerun_s=round(noop, 4), historical_rerun_s=hist[0], historical_manifest_rerun_s=hist[1],
+                files=per_file)
+
+def bench_metrics(Session, equipment):
+    out = {}
+    with Session() as db:
+        for equip in equipment:
+            span = runs_span(db, equip)
+            if span is None:
+                continue
+            t0 = time.perf_counter()
+            days = compute_metrics_range(db, equip, *span)
+            t1 = time.perf_counter()
+            rollups = compute_rollups_range(db, equip, *span)
+            t2 = time.perf_counter()
+            out[equip] = {"days": len(days), "metrics_s": round(t1 - t0, 4),
+                          "rollup_rows": len(rollups), "rollups_s": round(t2 - t1, 4)}
+    return out
+
+def bench_export(engine, tmp, memory=True):
+    stmt = runs_select()
+    out = {}
+
+    def csv_bytes(gzip):
+        return sum(len(c) for c in iter_csv(iter_rows(stmt, bind=engine), gzip=gzip))
+
+    for name, gz in (("csv", False), ("csv_gzip", True)):
+        n, res = timed(csv_bytes, gz, memory=memory)
+        out[name] = dict(res, bytes=n)
+    path = os.path.join(tmp, "bench.xlsx")
+    _, res = timed(write_xlsx, iter_rows(stmt, bind=engine), path, memory=False)
+    if memory:
+        _, mem = timed(lambda: write_xlsx(iter_rows(stmt, bind=engine), path))
+        res["peak_mb"] = mem["peak_mb"]
+    out["xlsx"] = dict(res, bytes=os.path.getsize(path))
+    with engine.connect() as conn:
+        out["rows"] = sum(1 for _ in conn.execute(stmt))
+    return out
+
+def bench_rebuild(engine, equipment):
+    # POST /runs/rebuild: sort-and-sweep of raw_logs into a shadow table, swap, metrics
+    out = {}
+    for equip in equipment:
+        t0 = time.perf_counter()
+        st = rebuild_equipment(equip, engine)
+        sec = time.perf_counter() - t0
+        out[equip] = dict(st, seconds=round(sec, 4), raw_per_s=rate(st["raw"], sec))
+    return out
+
+def git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(__file__)).decode().strip()
+    except Exception:
+        return None
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--months", type=int, default=6)
+    ap.add_argument("--lines", type=int, default=20000, help="lines per month file")
+    ap.add_argument("--equipment", nargs="+", default=["s100-1", "s100-2"])
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--logs", help="existing log tree (skip generation)")
+    ap.add_argument("--db-url", help="benchmark against this database instead of a temporary SQLite file")
+    ap.add_argument("--skip", nargs="*", default=[], choices=["micro", "parse", "readers", "ingest", "metrics", "export",
+                                                               "rebuild"])
+    ap.add_argument("--no-memory", action="store_true", help="skip the traced peak-memory passes")
+    ap.add_argument("--out", default="bench.json")
+    a = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="s100-bench-") as tmp:
+        root = a.logs
+        if not root:
+            root = os.path.join(tmp, "logs")
+            generate(root, a.equipment, a.months, a.lines, seed=a.seed, hist_dir_name=settings.HIST_DIR_NAME)
+        files = [(e, p) for e in a.equipment for p in files_for(root, e)]
+        engine = create_engine(a.db_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        upgrade(engine)  # runs / raw_logs views
+        Session = sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
+
+        results = {}
+        if "micro" not in a.skip:
+            with open(files[-1][1], encoding="utf-8") as f:
+                results["micro"] = bench_micro(f.read().splitlines())
+        if "parse" not in a.skip:
+            results["parse"] = bench_parse(files)
+        if "readers" not in a.skip:
+            results["readers"] = bench_readers(files, tmp)
+        if "ingest" not in a.skip:
+            results["ingest"] = bench_ingest(Session, files)
+        if "metrics" not in a.skip:
+            results["metrics"] = bench_metrics(Session, a.equipment)
+        if "export" not in a.skip:
+            results["export"] = bench_export(engine, tmp, memory=not a.no_memory)
+        if "rebuild" not in a.skip:  # last: replaces the runs the other stages measured
+            results["rebuild"] = bench_rebuild(engine, a.equipment)
+        engine.dispose()
+
+    report = {
+        "meta": {"at": datetime.now().isoformat(timespec="seconds"), "git": git_rev(),
+                 "python": sys.version.split()[0], "platform": platform.platform(),
+                 "db": engine.dialect.name, "months": a.months, "lines_per_month": a.lines,
+                 "equipment": a.equipment, "files": len(files), "seed": a.seed, "logs": a.logs},
+        "results": results,
+    }
+    with open(a.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    for stage, r in results.items():
+        print(stage, json.dumps({k: v for k, v in r.items() if k != "files"}))
+    print("->", a.out)
+
+if __name__ == "__main__":
+    main()
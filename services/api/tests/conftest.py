@@ -0,0 +1,27 @@
+import pytest
+from sqlalchemy import BigInteger, create_engine
+from sqlalchemy.dialects.mysql import TINYINT
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+
+from app.db import Base
+from app import dims, models  # noqa: F401  (registers the tables)
+from app.migrations import upgrade
+
+# SQLite stand-in for MySQL, as in bench/run_bench.py
+@compiles(TINYINT, "sqlite")
+def _tinyint(element, compiler, **kw):
+    return "SMALLINT"
+
+@compiles(BigInteger, "sqlite")
+def _bigint(element, compiler, **kw):
+    return "INTEGER"  # SQLite only autoincrements INTEGER PRIMARY KEY
+
+@pytest.fixture
+def Session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(engine)
+    upgrade(engine)
+    dims._cache.clear()  # dimension ids belong to the previous test's database
+    yield sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
+    engine.dispose()
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+
+from starlette.requests import Request
+
+from app.httpcache import Conditional
+from app.models import DataVersion
+from app.utils import TPE
+
+def _request(headers=None):
+    return Request({"type": "http", "method": "GET", "path": "/metrics/daily", "query_string": b"equipment=s100-1",
+                    "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]})
+
+def _changed(db, ago):
+    db.merge(DataVersion(equipment="s100-1", version=3,
+                         updated_at=datetime.now(TPE).replace(tzinfo=None, microsecond=0) - ago))
+    db.commit()
+
+def test_echoed_last_modified_is_not_modified(Session):
+    with Session() as db:
+        _changed(db, timedelta(seconds=5))
+        first = Conditional(_request(), db, "s100-1")
+        assert "Last-Modified" in first.headers
+        again = Conditional(_request({"If-Modified-Since": first.headers["Last-Modified"]}), db, "s100-1")
+        assert again.fresh()
+
+def test_no_last_modified_within_the_second_of_a_change(Session):
+    with Session() as db:
+        _changed(db, timedelta(0))
+        cond = Conditional(_request(), db, "s100-1")
+        assert "Last-Modified" not in cond.headers
+        date = "Thu, 01 Jan 2099 00:00:00 GMT"
+        assert not Conditional(_request({"If-Modified-Since": date}), db, "s100-1").fresh()
+        assert Conditional(_request({"If-None-Match": cond.etag}), db, "s100-1").fresh()
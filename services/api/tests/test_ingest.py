@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from app.ingest import RunIndex, ingest_file
+
+LINE = ("StTime=2025/9/1-10:00, SpTime=2025/9/1-11:00, TotalTime=3600s, Project=ACME_P100, "
+        "LogName=S0001_4P7V_C1_25C_TT_S12COB_s1\n")
+
+def test_run_index_loads_runs_for_a_reversed_range(Session, tmp_path):
+    path = tmp_path / "202509_total_run_time.txt"
+    path.write_text(LINE)
+    with Session() as db:
+        ingest_file(db, "s100-1", str(path))
+        index = RunIndex("s100-1")
+        index.ensure(db, datetime(2025, 9, 1, 12), datetime(2025, 9, 1, 9))  # stop before start
+        assert len(index.loaded_ids) == 1
+        index.ensure(db, datetime(2025, 9, 1, 9, 30), datetime(2025, 9, 1, 10, 30))
+        assert index.overlapping(RunIndex.key("ACME", "P100", "S0001", "C1"),
+                                 datetime(2025, 9, 1, 10, 15), datetime(2025, 9, 1, 10, 45))
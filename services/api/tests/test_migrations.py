@@ -0,0 +1,20 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects import mysql
+
+from app.migrations import add_column_ddl, add_missing_columns
+from app.models import IngestionState
+
+def test_add_column_ddl_quotes_reserved_words_for_mysql():
+    table = IngestionState.__table__
+    ddl = add_column_ddl(mysql.dialect(), table, table.c.lines)
+    assert ddl == "ALTER TABLE ingestion_state ADD COLUMN `lines` INTEGER NULL"
+
+def test_add_missing_columns_adds_manifest_columns(Session):
+    engine = Session.kw["bind"]
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE ingestion_state"))
+        conn.execute(text("CREATE TABLE ingestion_state (id INTEGER PRIMARY KEY, equipment VARCHAR(32), "
+                          "source_file VARCHAR(512), last_ingested_at DATETIME)"))
+    add_missing_columns(engine)
+    have = {c["name"] for c in inspect(engine).get_columns("ingestion_state")}
+    assert {"lines", "raw_new", "raw_dup", "content_sha1", "ingest_s"} <= have
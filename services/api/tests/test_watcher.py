@@ -0,0 +1,54 @@
+import time
+from datetime import datetime
+
+from app.config import settings
+from app.ingest import ingest_current_month
+from app.models import RawLog, RunView
+from app.utils import TPE
+from app.watcher import Watcher
+
+LINES = [
+    "StTime=2025/9/1-8:00, SpTime=2025/9/1-9:00, TotalTime=3600s, Project=ACME_P100, "
+    "LogName=S0001_4P7V_C1_25C_TT_S12COB_s1, User=u1, PrgVer=1.0, CodeVer=2.0",
+    "StTime=2025/9/1-10:00, SpTime=2025/9/1-12:30, TotalTime=9000s, Project=ACME_P100, "
+    "LogName=S0002_4P7V_C2_25C_TT_S12COB_s2, User=u1, PrgVer=1.0, CodeVer=2.0",
+]
+
+def _wait(cond, timeout=10.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        if cond():
+            return True
+        time.sleep(0.05)
+    return False
+
+def test_watch_ingest_of_half_written_line(Session, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "WATCH_POLL_S", 0.1)
+    monkeypatch.setattr(settings, "WATCH_DEBOUNCE_S", 0.0)
+    monkeypatch.setattr(settings, "WATCH_MIN_INTERVAL_S", 0.0)
+    now = datetime.now(TPE)
+    path = tmp_path / f"{now.year:04d}{now.month:02d}_total_run_time.txt"
+    cut = LINES[1].index("_C2")  # the second line stops inside its LogName
+    path.write_text(LINES[0] + "\n" + LINES[1][:cut])
+
+    def ingest(equip, progress):
+        with Session() as db:
+            return ingest_current_month(db, equip, str(tmp_path), progress)
+
+    w = Watcher([("s100-t", str(tmp_path))], ingest, mode="poll")
+    w.start()
+    try:
+        assert _wait(lambda: w.health()["equipment"]["s100-t"]["ingests"] >= 1)
+        with Session() as db:
+            assert db.query(RawLog).count() == 1  # the unfinished line is not ingested yet
+
+        with open(path, "a") as f:
+            f.write(LINES[1][cut:] + "\n")
+        assert _wait(lambda: w.health()["equipment"]["s100-t"]["ingests"] >= 2)
+    finally:
+        w.stop()
+
+    with Session() as db:
+        assert db.query(RawLog).count() == 2
+        runs = db.query(RunView).order_by(RunView.st_time).all()
+        assert [(r.sample_no, r.test_item) for r in runs] == [("S0001", "C1"), ("S0002", "C2")]
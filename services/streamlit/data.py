@@ -0,0 +1,136 @@
+import os
+from datetime import date
+import streamlit as st
+import pandas as pd
+from sqlalchemy import create_engine, text as sqltext
+
+# 儀表板資料層：聚合在 SQL 端完成，結果以 (篩選條件, 資料版本) 為 key 快取；
+# 匯入/重算稼動率時 API 會遞增 data_versions，版本一變快取即失效
+
+DB_HOST = os.getenv("DB_HOST","localhost")
+DB_PORT = int(os.getenv("DB_PORT","3306"))
+DB_NAME = os.getenv("DB_NAME","s100logs")
+DB_USER = os.getenv("DB_USER","app")
+DB_PASS = os.getenv("DB_PASS","app123")
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR","/exports/archive")  # API 每月產生的 runs Parquet 封存
+
+@st.cache_resource
+def get_engine():
+    return create_engine(f"mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4",
+                         pool_pre_ping=True, pool_recycle=3600)
+
+def _read(q, params):
+    return pd.read_sql(sqltext(q), get_engine(), params=params)
+
+@st.cache_data(ttl=5)
+def data_version() -> str:
+    # 所有設備版本合成一個 token；每次重繪最多 5 秒查一次
+    row = _read("SELECT COALESCE(SUM(version),0) AS v, COUNT(*) AS n FROM data_versions", {}).iloc[0]
+    return f"{int(row['v'])}-{int(row['n'])}"
+
+@st.cache_data(ttl=60)
+def equipment_names() -> list:
+    # 設備清單由 API 維護的 equipment 登錄表提供，新增機台不必改儀表板
+    return _read("SELECT name FROM equipment WHERE enabled=1 ORDER BY name", {})["name"].tolist()
+
+def _runs_where(equipment, start_date, end_date):
+    q = " WHERE st_time>=:st AND sp_time<:ed"
+    params = {"st": f"{start_date} 00:00:00", "ed": f"{end_date} 23:59:59"}
+    if equipment:
+        q += " AND equipment=:eq"
+        params["eq"] = equipment
+    return q, params
+
+@st.cache_data(max_entries=64)
+def load_daily(equipment, start_date, end_date, version):
+    q = "SELECT * FROM metrics_daily WHERE day>=:st AND day<:ed"
+    params = {"st": f"{start_date} 00:00:00", "ed": f"{end_date} 23:59:59"}
+    if equipment:
+        q += " AND equipment=:eq"
+        params["eq"] = equipment
+    return _read(q, params)
+
+def _rollup_where(equipment, start_date, end_date):
+    q = " WHERE day>=:st AND day<:ed"
+    params = {"st": f"{start_date} 00:00:00", "ed": f"{end_date} 23:59:59"}
+    if equipment:
+        q += " AND equipment=:eq"
+        params["eq"] = equipment
+    return q, params
+
+@st.cache_data(max_entries=64)
+def project_hours(equipment, start_date, end_date, version):
+    # 讀每日彙總表 rollup_project_daily（以起始日歸屬），不掃 runs
+    where, params = _rollup_where(equipment, start_date, end_date)
+    df = _read("SELECT equipment, NULLIF(project_customer,'') AS project_customer, NULLIF(project_code,'') AS project_code,"
+               " SUM(duration_s) AS duration_s FROM rollup_project_daily" + where +
+               " GROUP BY equipment, project_customer, project_code ORDER BY equipment, project_customer, project_code",
+               params)
+    df["duration_s"] = df["duration_s"].astype("int64")  # MySQL SUM() 回傳 DECIMAL
+    df["duration_hr"] = df["duration_s"] / 3600.0
+    return df
+
+@st.cache_data(max_entries=64)
+def eng_hours(equipment, start_date, end_date, version):
+    where, params = _rollup_where(equipment, start_date, end_date)
+    df = _read("SELECT equipment, CASE WHEN eng_flag=1 THEN 'ENG' ELSE '正式' END AS type, SUM(duration_s) AS duration_s"
+               " FROM rollup_project_daily" + where + " GROUP BY equipment, type ORDER BY equipment, type", params)
+    df["duration_s"] = df["duration_s"].astype("int64")
+    df["hr"] = df["duration_s"] / 3600.0
+    return df
+
+def _archived_runs(equipment, start_date, end_date):
+    # 整段區間都是已結束且已封存的月份時，直接讀 Parquet（不查 MySQL）；否則回傳 None 改查 DB
+    today = date.today()
+    if (end_date.year, end_date.month) >= (today.year, today.month):
+        return None
+    months, (y, m) = [], (start_date.year, start_date.month)
+    while (y, m) <= (end_date.year, end_date.month):
+        months.append((y, m))
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    paths = [os.path.join(ARCHIVE_DIR, e, f"{y:04d}{m:02d}.parquet")
+             for e in ([equipment] if equipment else equipment_names()) for y, m in months]
+    if not paths or not all(os.path.exists(p) for p in paths):
+        return None
+    df = pd.concat([pd.read_parquet(p) for p in paths], ignore_index=True)
+    for c in df.columns:
+        if isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype(object)  # 字典編碼欄位還原成一般字串欄
+    df = df[(df["st_time"] >= pd.Timestamp(f"{start_date} 00:00:00")) & (df["sp_time"] < pd.Timestamp(f"{end_date} 23:59:59"))]
+    return df.sort_values("st_time", kind="stable").reset_index(drop=True)
+
+@st.cache_data(max_entries=64)
+def quality(equipment, start_date, end_date, version):
+    df = _archived_runs(equipment, start_date, end_date)
+    if df is not None:
+        blank = lambda c: df[c].fillna("").astype(str).eq("")
+        return {"n": len(df), "missing_user": int(blank("user").sum()), "missing_prgver": int(blank("prgver").sum()),
+                "missing_codever": int(blank("codever").sum()), "zero_dur": int(df["duration_s"].fillna(0).eq(0).sum()),
+                "mismatch": int(df["conflict_reason"].eq("time_mismatch").sum())}
+    where, params = _runs_where(equipment, start_date, end_date)
+    row = _read(
+        "SELECT COUNT(*) AS n,"
+        " SUM(CASE WHEN COALESCE(user,'')='' THEN 1 ELSE 0 END) AS missing_user,"
+        " SUM(CASE WHEN COALESCE(prgver,'')='' THEN 1 ELSE 0 END) AS missing_prgver,"
+        " SUM(CASE WHEN COALESCE(codever,'')='' THEN 1 ELSE 0 END) AS missing_codever,"
+        " SUM(CASE WHEN COALESCE(duration_s,0)=0 THEN 1 ELSE 0 END) AS zero_dur,"
+        " SUM(CASE WHEN conflict_reason='time_mismatch' THEN 1 ELSE 0 END) AS mismatch"
+        " FROM runs" + where, params).iloc[0]
+    return {k: int(v) if pd.notna(v) else 0 for k, v in row.items()}
+
+@st.cache_data(max_entries=64)
+def first_records(equipment, start_date, end_date, version, limit=300):
+    df = _archived_runs(equipment, start_date, end_date)
+    if df is not None:
+        return df.head(int(limit))
+    where, params = _runs_where(equipment, start_date, end_date)
+    return _read("SELECT * FROM runs" + where + f" ORDER BY st_time LIMIT {int(limit)}", params)
+
+@st.cache_data(max_entries=8)
+def records_csv(equipment, start_date, end_date, version) -> bytes:
+    # 原始記錄只給下載用；同一組篩選只抓一次、只轉一次 CSV；已封存月份讀 Parquet
+    df = _archived_runs(equipment, start_date, end_date)
+    if df is None:
+        where, params = _runs_where(equipment, start_date, end_date)
+        df = _read("SELECT * FROM runs" + where, params)
+    return df.to_csv(index=False).encode("utf-8")